@@ -0,0 +1,180 @@
+"""Admission control for the polling endpoints
+
+Polling views wrapped with @polling() get three protections, none of which
+apply to trades or page views:
+
+- single flight: identical requests that arrive while one is already running
+  wait for it and share its response instead of running the view again
+- a token bucket per session (or client address) limiting the polling rate
+- load shedding: when more than SHED_THRESHOLD requests are in flight, or all
+  POLL_SLOTS are busy, the last good response is served with Retry-After
+  instead of doing new work, so threads stay free for trade execution
+"""
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, g, make_response, request, session
+
+# Tokens per second and bucket size per session; a rate of 0 disables limiting
+POLL_RATE = float(os.environ.get('STOCKER_POLL_RATE', 1))
+POLL_BURST = float(os.environ.get('STOCKER_POLL_BURST', 10))
+# Shed polling above this many requests in flight, or when every poll slot is busy
+SHED_THRESHOLD = int(os.environ.get('STOCKER_SHED_THRESHOLD', 64))
+POLL_SLOTS = int(os.environ.get('STOCKER_POLL_SLOTS', 16))
+RETRY_AFTER = int(os.environ.get('STOCKER_RETRY_AFTER', 5))
+MAX_BUCKETS = 100000
+# Last good responses kept for shedding, least recently used dropped first
+MAX_SNAPSHOTS = int(os.environ.get('STOCKER_POLL_SNAPSHOTS', 10000))
+
+_lock = threading.Lock()
+_in_flight = 0
+# key -> _Call for requests currently running
+_calls = {}
+# key -> (body, status, mimetype) of the last successful response
+_snapshots = OrderedDict()
+# client -> [tokens, last refill time]
+_buckets = {}
+_poll_slots = threading.BoundedSemaphore(POLL_SLOTS)
+
+stats = {'coalesced': 0, 'rate_limited': 0, 'shed': 0}
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def in_flight():
+    return _in_flight
+
+
+def init_app(app):
+    """Track how many requests are in flight, for load shedding"""
+
+    @app.before_request
+    def enter():
+        global _in_flight
+        with _lock:
+            _in_flight += 1
+        g.admission_counted = True
+
+    @app.teardown_request
+    def leave(exc):
+        global _in_flight
+        if g.pop('admission_counted', False):
+            with _lock:
+                _in_flight -= 1
+
+
+def allow(client):
+    """Take a token from a client's bucket; False when it is empty"""
+    if not POLL_RATE:
+        return True
+    now = time.monotonic()
+    with _lock:
+        bucket = _buckets.get(client)
+        if bucket is None:
+            if len(_buckets) >= MAX_BUCKETS:
+                _buckets.clear()
+            bucket = _buckets[client] = [POLL_BURST, now]
+        bucket[0] = min(POLL_BURST, bucket[0] + (now - bucket[1]) * POLL_RATE)
+        bucket[1] = now
+        if bucket[0] < 1:
+            return False
+        bucket[0] -= 1
+        return True
+
+
+def single_flight(key, run):
+    """Run run() once for all concurrent callers with the same key"""
+    with _lock:
+        call = _calls.get(key)
+        leader = call is None
+        if leader:
+            call = _calls[key] = _Call()
+        else:
+            stats['coalesced'] += 1
+
+    if not leader:
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.result
+
+    try:
+        call.result = run()
+    except Exception as e:
+        call.error = e
+        raise
+    finally:
+        with _lock:
+            del _calls[key]
+        call.done.set()
+    return call.result
+
+
+def _respond(body, status, mimetype, retry_after=None):
+    response = Response(body, status=status, mimetype=mimetype)
+    if retry_after:
+        response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def _fallback(key, status):
+    """The last good response for key with Retry-After, or an empty error"""
+    with _lock:
+        snapshot = _snapshots.get(key)
+        if snapshot is not None:
+            _snapshots.move_to_end(key)
+    if snapshot is not None:
+        return _respond(*snapshot, retry_after=RETRY_AFTER)
+    return _respond('{"error": "Server busy"}', status, 'application/json', retry_after=RETRY_AFTER)
+
+
+def _remember(key, snapshot):
+    with _lock:
+        _snapshots[key] = snapshot
+        _snapshots.move_to_end(key)
+        while len(_snapshots) > MAX_SNAPSHOTS:
+            _snapshots.popitem(last=False)
+
+
+def polling(shared=False):
+    """Decorate a read-only polling view
+
+    Responses are coalesced per endpoint and arguments, and also per session
+    user unless shared is set, so a view's authorization checks still apply.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = (request.endpoint, tuple(sorted(kwargs.items())),
+                   None if shared else session.get('user_id'))
+
+            client = session.get('user_id') or request.remote_addr
+            if not allow(client):
+                stats['rate_limited'] += 1
+                return _fallback(key, 429)
+
+            if _in_flight > SHED_THRESHOLD or not _poll_slots.acquire(blocking=False):
+                stats['shed'] += 1
+                return _fallback(key, 503)
+
+            def run():
+                response = make_response(view(*args, **kwargs))
+                return response.get_data(), response.status_code, response.mimetype
+
+            try:
+                body, status, mimetype = single_flight(key, run)
+            finally:
+                _poll_slots.release()
+            if status == 200:
+                _remember(key, (body, status, mimetype))
+            return _respond(body, status, mimetype)
+        return wrapper
+    return decorator
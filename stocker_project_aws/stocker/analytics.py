@@ -0,0 +1,251 @@
+import threading
+from collections import deque
+from datetime import datetime
+
+import numpy as np
+
+# Rolling window of simulated price ticks used as price history
+PRICE_HISTORY_SIZE = 2000
+VAR_CONFIDENCE = 0.95
+
+_price_history = deque(maxlen=PRICE_HISTORY_SIZE)
+_tick_version = 0
+_cache = {}
+_generations = {}
+_lock = threading.Lock()
+
+stats = {'hits': 0, 'misses': 0}
+
+
+def record_tick(stocks):
+    """Append a snapshot of current prices to the price history"""
+    global _tick_version
+    snapshot = {symbol: data['price'] for symbol, data in stocks.items()}
+    with _lock:
+        _price_history.append((np.datetime64(datetime.utcnow(), 's'), snapshot))
+        _tick_version += 1
+
+
+def invalidate(user_id):
+    """Drop cached analytics for a user after a new trade"""
+    with _lock:
+        _cache.pop(user_id, None)
+        _generations[user_id] = _generations.get(user_id, 0) + 1
+
+
+def load_trades(user_id, connect, load_archived=None):
+    """Load a user's trades and current balance as column arrays
+
+    load_archived(user_id) may return archived rows in trades table column
+    order; they are merged ahead of the hot rows.
+    """
+    conn = connect(user_id)
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT timestamp, symbol, action, quantity, price, total
+        FROM trades WHERE user_id = ?
+        ORDER BY timestamp, id
+    ''', (user_id,))
+    rows = cursor.fetchall()
+    cursor.execute('SELECT balance FROM users WHERE id = ?', (user_id,))
+    balance = cursor.fetchone()
+    conn.close()
+
+    if load_archived:
+        archived = [(ts, symbol, action, quantity, price, total)
+                    for _, _, symbol, action, quantity, price, total, ts in load_archived(user_id)]
+        rows = sorted(archived + rows, key=lambda row: row[0])
+
+    if rows:
+        timestamps, symbols, actions, quantities, prices, totals = zip(*rows)
+    else:
+        timestamps = symbols = actions = quantities = prices = totals = ()
+
+    sign = np.where(np.array(actions, dtype=object) == 'buy', 1, -1)
+    return {
+        'time': np.array(timestamps, dtype='datetime64[s]'),
+        'symbol': np.array(symbols, dtype=object),
+        'quantity': np.array(quantities, dtype=np.int64) * sign,
+        'price': np.array(prices, dtype=np.float64),
+        'total': np.array(totals, dtype=np.float64) * sign,
+        'balance': balance[0] if balance else 0.0,
+    }
+
+
+def _forward_fill(matrix):
+    """Carry the last observed value down each column, leaving leading NaNs as 0"""
+    rows = np.arange(matrix.shape[0])[:, None]
+    index = np.where(np.isnan(matrix), 0, rows)
+    np.maximum.accumulate(index, axis=0, out=index)
+    filled = matrix[index, np.arange(matrix.shape[1])]
+    return np.nan_to_num(filled)
+
+
+def _segment_starts(is_start):
+    """Index of the segment start for every row"""
+    starts = np.where(is_start, np.arange(len(is_start)), 0)
+    return np.maximum.accumulate(starts)
+
+
+def _linear_scan(a, b):
+    """Solve x[t] = a[t] * x[t-1] + b[t] with x[-1] = 0 as a parallel prefix scan"""
+    a = a.copy()
+    b = b.copy()
+    shift = 1
+    while shift < len(a):
+        b[shift:] = a[shift:] * b[:-shift] + b[shift:]
+        a[shift:] = a[shift:] * a[:-shift]
+        shift *= 2
+    return b
+
+
+def cost_basis(symbol_codes, quantity, price):
+    """Average-cost basis and realized P&L per trade, as in execute_trade
+
+    Trades must be in time order. Within a symbol, a buy adds its cost and a
+    sell scales the basis by the fraction of shares kept, so the basis follows
+    c[t] = a[t] * c[t-1] + b[t], which is solved without division so long
+    holding periods cannot underflow.
+    """
+    n = len(quantity)
+    if n == 0:
+        return np.zeros(0), np.zeros(0)
+
+    order = np.lexsort((np.arange(n), symbol_codes))
+    sym = symbol_codes[order]
+    qty = quantity[order].astype(np.float64)
+    px = price[order]
+
+    new_symbol = np.empty(n, dtype=bool)
+    new_symbol[0] = True
+    new_symbol[1:] = sym[1:] != sym[:-1]
+
+    # Running position per symbol
+    cum = np.cumsum(qty)
+    pos = cum - (cum - qty)[_segment_starts(new_symbol)]
+    pos_before = pos - qty
+
+    is_sell = qty < 0
+    with np.errstate(divide='ignore', invalid='ignore'):
+        kept = np.where(pos_before > 0, np.maximum(pos, 0) / pos_before, 0.0)
+    a = np.where(is_sell, kept, 1.0)
+    a[new_symbol] = 0.0
+    basis = _linear_scan(a, np.where(is_sell, 0.0, qty * px))
+
+    basis_before = np.where(new_symbol, 0.0, np.roll(basis, 1))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        avg_before = np.where(pos_before > 0, basis_before / pos_before, 0.0)
+    realized = np.where(is_sell, -qty * (px - avg_before), 0.0)
+
+    result_basis = np.empty(n)
+    result_realized = np.empty(n)
+    result_basis[order] = basis
+    result_realized[order] = realized
+    return result_basis, result_realized
+
+
+def compute_analytics(trades, stocks, ticks=()):
+    """Rebuild position, cash and equity series and derive risk metrics"""
+    symbols, codes = np.unique(trades['symbol'], return_inverse=True)
+    codes = codes.astype(np.int64)
+    n_trades = len(codes)
+    n_symbols = len(symbols)
+
+    if n_trades == 0:
+        return {
+            'trades': 0,
+            'time_weighted_return': 0.0,
+            'volatility': 0.0,
+            'max_drawdown': 0.0,
+            'realized_pnl': 0.0,
+            'unrealized_pnl': 0.0,
+            'value_at_risk': 0.0,
+            'equity': float(trades['balance']),
+        }
+
+    # Only ticks after the first trade matter; earlier equity is all cash
+    first_trade = trades['time'][0]
+    ticks = [(ts, prices) for ts, prices in ticks if ts >= first_trade]
+    n_ticks = len(ticks)
+    n_events = n_trades + n_ticks
+
+    times = np.empty(n_events, dtype='datetime64[s]')
+    times[:n_trades] = trades['time']
+    prices = np.full((n_events, n_symbols), np.nan)
+    prices[np.arange(n_trades), codes] = trades['price']
+    if n_ticks:
+        times[n_trades:] = [ts for ts, _ in ticks]
+        prices[n_trades:] = [[snapshot.get(s, np.nan) for s in symbols] for _, snapshot in ticks]
+
+    deltas = np.zeros((n_events, n_symbols))
+    deltas[np.arange(n_trades), codes] = trades['quantity']
+    flows = np.zeros(n_events)
+    flows[:n_trades] = -trades['total']
+
+    # Merge trades and ticks on one timeline; trades win ties
+    order = np.argsort(times, kind='stable')
+    prices = _forward_fill(prices[order])
+    positions = np.cumsum(deltas[order], axis=0)
+    cash_start = trades['balance'] - flows.sum()
+    cash = cash_start + np.cumsum(flows[order])
+
+    # Mark the final state to current prices
+    current = np.array([stocks.get(s, {}).get('price', np.nan) for s in symbols])
+    current = np.where(np.isnan(current), prices[-1], current)
+    equity = np.append(cash + (positions * prices).sum(axis=1),
+                       cash[-1] + positions[-1] @ current)
+    equity = np.insert(equity, 0, cash_start)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = np.diff(equity) / equity[:-1]
+    returns = returns[np.isfinite(returns)]
+
+    peaks = np.maximum.accumulate(equity)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdowns = np.where(peaks > 0, equity / peaks - 1.0, 0.0)
+
+    basis, realized = cost_basis(codes, trades['quantity'], trades['price'])
+    last_index = np.zeros(n_symbols, dtype=np.int64)
+    np.maximum.at(last_index, codes, np.arange(n_trades))
+    unrealized = positions[-1] @ current - basis[last_index].sum()
+
+    if len(returns):
+        twr = float(np.prod(1.0 + returns) - 1.0)
+        volatility = float(returns.std())
+        var = float(max(0.0, -np.quantile(returns, 1 - VAR_CONFIDENCE)) * equity[-1])
+    else:
+        twr = volatility = var = 0.0
+
+    return {
+        'trades': n_trades,
+        'time_weighted_return': twr,
+        'volatility': volatility,
+        'max_drawdown': float(drawdowns.min()),
+        'realized_pnl': float(realized.sum()),
+        'unrealized_pnl': float(unrealized),
+        'value_at_risk': var,
+        'equity': float(equity[-1]),
+    }
+
+
+def get_user_analytics(user_id, stocks, connect, load_archived=None):
+    """Cached analytics for a user; trades reload only after invalidate()"""
+    with _lock:
+        entry = _cache.get(user_id)
+        version = _tick_version
+        generation = _generations.get(user_id, 0)
+        if entry and entry['tick_version'] == version:
+            stats['hits'] += 1
+            return entry['result']
+        stats['misses'] += 1
+        ticks = list(_price_history)
+
+    trades = entry['trades'] if entry else load_trades(user_id, connect, load_archived)
+    result = compute_analytics(trades, stocks, ticks)
+
+    with _lock:
+        # A trade landed while computing; let the next call reload
+        if _generations.get(user_id, 0) != generation:
+            return result
+        _cache[user_id] = {'trades': trades, 'tick_version': version, 'result': result}
+    return result
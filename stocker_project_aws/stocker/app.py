@@ -1,45 +1,102 @@
 import sqlite3
-import hashlib
+import heapq
 import random
+import csv
+import io
+import os
+import time
 from datetime import datetime, timedelta
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash, Response
+
+import admission
+import analytics
+import archive
+import assets
+import fills
+import jobs
+import metrics
+import passwords
+import render_cache
+import replica
+import sharding
+import symbols
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-in-production'
+metrics.init_app(app)
+admission.init_app(app)
+assets.init_app(app)
+
+# Live prices for the symbol universe, from symbols.py
+STOCKS = symbols.load_stocks()
+
+# Bumped on every price tick; keys the shared rendering cache
+price_version = 0
+
+# Seconds between saves of the live prices to symbols.PRICES_SNAPSHOT
+PRICES_SNAPSHOT_INTERVAL = float(os.environ.get('STOCKER_PRICES_SNAPSHOT_INTERVAL', 60))
+prices_saved_at = None
+
+# Above this many symbols the dashboard grid is rendered client-side, visible rows only
+VIRTUAL_GRID_THRESHOLD = int(os.environ.get('STOCKER_VIRTUAL_GRID_THRESHOLD', 200))
+
+def get_db(user_id):
+    return sharding.connect_user(user_id)
+
+def read_db(shard):
+    # Heavy admin reads go to the snapshot replica when it is enabled
+    if replica.ENABLED:
+        return replica.connect(sharding.shard_path(shard))
+    return sharding.connect_shard(shard)
+
+def archived_trades(user_id, start=None, end=None):
+    return archive.read_trades(sharding.shard_for(user_id), user_id, start, end)
+
+def get_user_trades(user_id, start=None, end=None):
+    # Hot trades, plus the archive when the range reaches back to archived trades
+    query = 'SELECT symbol, action, quantity, price, total, timestamp FROM trades WHERE user_id = ?'
+    params = [user_id]
+    if start:
+        query += ' AND timestamp >= ?'
+        params.append(start)
+    if end:
+        query += ' AND timestamp <= ?'
+        params.append(end)
+    
+    conn = get_db(user_id)
+    cursor = conn.cursor()
+    cursor.execute(query + ' ORDER BY timestamp DESC', params)
+    trades = cursor.fetchall()
+    conn.close()
+    
+    if archive.reaches_archive(sharding.shard_for(user_id), start):
+        trades += [row[2:] for row in archived_trades(user_id, start, end)]
+        trades.sort(key=lambda trade: trade[5], reverse=True)
+    
+    return trades
 
-# Sample stock data with realistic prices
-STOCKS = {
-    'AAPL': {'name': 'Apple Inc.', 'price': 185.50, 'change': 2.75},
-    'GOOGL': {'name': 'Alphabet Inc.', 'price': 142.30, 'change': -1.20},
-    'MSFT': {'name': 'Microsoft Corp.', 'price': 378.85, 'change': 4.60},
-    'AMZN': {'name': 'Amazon.com Inc.', 'price': 145.75, 'change': -2.85},
-    'TSLA': {'name': 'Tesla Inc.', 'price': 248.42, 'change': 8.90},
-    'META': {'name': 'Meta Platforms', 'price': 325.60, 'change': 5.25},
-    'NVDA': {'name': 'NVIDIA Corp.', 'price': 875.30, 'change': 12.40},
-    'NFLX': {'name': 'Netflix Inc.', 'price': 445.20, 'change': -3.75},
-    'ADBE': {'name': 'Adobe Inc.', 'price': 485.90, 'change': 6.80},
-    'CRM': {'name': 'Salesforce Inc.', 'price': 215.40, 'change': -1.95},
-    'ORCL': {'name': 'Oracle Corp.', 'price': 102.85, 'change': 1.30},
-    'IBM': {'name': 'IBM', 'price': 158.75, 'change': 0.85},
-    'INTC': {'name': 'Intel Corp.', 'price': 43.20, 'change': -0.60},
-    'AMD': {'name': 'AMD Inc.', 'price': 142.60, 'change': 3.45},
-    'UBER': {'name': 'Uber Technologies', 'price': 65.40, 'change': 2.10},
-    'LYFT': {'name': 'Lyft Inc.', 'price': 14.85, 'change': -0.35},
-    'SPOT': {'name': 'Spotify Technology', 'price': 185.20, 'change': 4.20},
-    'ZOOM': {'name': 'Zoom Video', 'price': 68.90, 'change': -1.15},
-    'SQ': {'name': 'Block Inc.', 'price': 78.35, 'change': 2.80},
-    'PYPL': {'name': 'PayPal Holdings', 'price': 62.45, 'change': -0.95},
-    'V': {'name': 'Visa Inc.', 'price': 245.70, 'change': 1.85},
-    'MA': {'name': 'Mastercard Inc.', 'price': 385.20, 'change': 3.60},
-    'JPM': {'name': 'JPMorgan Chase', 'price': 158.90, 'change': 2.25},
-    'GS': {'name': 'Goldman Sachs', 'price': 365.80, 'change': -1.40},
-    'WMT': {'name': 'Walmart Inc.', 'price': 158.25, 'change': 0.75},
-    'HD': {'name': 'Home Depot', 'price': 345.60, 'change': 4.15},
-    'PG': {'name': 'Procter & Gamble', 'price': 155.30, 'change': 0.90}
-}
+def parse_date_range(args):
+    # Optional ?start=YYYY-MM-DD&end=YYYY-MM-DD filters, as timestamp bounds
+    try:
+        start = args.get('start') or None
+        end = args.get('end') or None
+        if start:
+            start = datetime.strptime(start, '%Y-%m-%d').strftime('%Y-%m-%d 00:00:00')
+        if end:
+            end = datetime.strptime(end, '%Y-%m-%d').strftime('%Y-%m-%d 23:59:59')
+    except ValueError:
+        flash('Invalid date range!')
+        return None, None
+    return start, end
 
 def init_db():
-    conn = sqlite3.connect('stocker.db')
+    for shard in range(sharding.SHARD_COUNT):
+        conn = sharding.connect_shard(shard)
+        create_tables(conn)
+        conn.close()
+    sharding.init_directory()
+
+def create_tables(conn):
     cursor = conn.cursor()
     
     # Users table
@@ -51,10 +108,16 @@ def init_db():
             password_hash TEXT NOT NULL,
             role TEXT DEFAULT 'trader',
             balance REAL DEFAULT 10000.0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            status TEXT DEFAULT 'active'
         )
     ''')
     
+    # Databases created before account status existed
+    columns = [row[1] for row in cursor.execute('PRAGMA table_info(users)')]
+    if 'status' not in columns:
+        cursor.execute("ALTER TABLE users ADD COLUMN status TEXT DEFAULT 'active'")
+    
     # Trades table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS trades (
@@ -83,14 +146,13 @@ def init_db():
         )
     ''')
     
+    # Per-user history, analytics and chunked deletes all look trades up by user
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_trades_user ON trades (user_id, timestamp)')
+    
     conn.commit()
-    conn.close()
-
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
 
 def get_user_portfolio(user_id):
-    conn = sqlite3.connect('stocker.db')
+    conn = get_db(user_id)
     cursor = conn.cursor()
     cursor.execute('''
         SELECT symbol, quantity, avg_price FROM portfolio 
@@ -121,7 +183,7 @@ def get_user_portfolio(user_id):
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    return render_cache.page('index.html')
 
 @app.route('/signup', methods=['GET', 'POST'])
 def signup():
@@ -131,42 +193,77 @@ def signup():
         password = request.form['password']
         role = request.form.get('role', 'trader')
         
-        conn = sqlite3.connect('stocker.db')
+        try:
+            password_hash = passwords.hash_password(password)
+        except passwords.Busy:
+            flash('Too many sign-ups right now, please try again in a moment!')
+            return render_cache.page('signup.html'), 503, {'Retry-After': str(admission.RETRY_AFTER)}
+        
+        try:
+            # Reserve a unique id and shard; ids come from the users table when unsharded
+            user_id, shard = sharding.register_user(username, email)
+        except sqlite3.IntegrityError:
+            flash('Username or email already exists!')
+            return render_cache.page('signup.html')
+        
+        conn = sharding.connect_shard(shard)
         cursor = conn.cursor()
         
         try:
-            password_hash = hash_password(password)
             cursor.execute('''
-                INSERT INTO users (username, email, password_hash, role)
-                VALUES (?, ?, ?, ?)
-            ''', (username, email, password_hash, role))
+                INSERT INTO users (id, username, email, password_hash, role)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (user_id, username, email, password_hash, role))
             conn.commit()
             flash('Account created successfully! You can now log in.')
             return redirect(url_for('login'))
         except sqlite3.IntegrityError:
+            if user_id is not None:
+                sharding.unregister_user(user_id)
             flash('Username or email already exists!')
         finally:
             conn.close()
     
-    return render_template('signup.html')
+    return render_cache.page('signup.html')
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        password_hash = hash_password(password)
         
-        conn = sqlite3.connect('stocker.db')
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT id, username, role FROM users 
-            WHERE username = ? AND password_hash = ?
-        ''', (username, password_hash))
-        user = cursor.fetchone()
-        conn.close()
+        user = None
+        shard = sharding.find_user_shard(username)
+        if shard is not None:
+            conn = sharding.connect_shard(shard)
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, username, role, status, password_hash FROM users 
+                WHERE username = ?
+            ''', (username,))
+            user = cursor.fetchone()
+            conn.close()
         
+        # The hash runs on the passwords worker pool, outside any connection; unknown
+        # usernames are checked against a dummy hash so timing does not reveal which exist
+        try:
+            matches, new_hash = passwords.verify(password, user[4] if user else passwords.DUMMY_HASH)
+        except passwords.Busy:
+            flash('Too many logins right now, please try again in a moment!')
+            return render_cache.page('login.html'), 503, {'Retry-After': str(admission.RETRY_AFTER)}
         if user:
+            if not matches:
+                user = None
+            elif new_hash:
+                # Upgrade legacy SHA-256 and old-cost hashes on a successful login
+                conn = sharding.connect_shard(shard)
+                conn.execute('UPDATE users SET password_hash = ? WHERE id = ?', (new_hash, user[0]))
+                conn.commit()
+                conn.close()
+        
+        if user and user[3] != jobs.ACTIVE:
+            flash('This account is not active!')
+        elif user:
             session['user_id'] = user[0]
             session['username'] = user[1]
             session['role'] = user[2]
@@ -178,7 +275,7 @@ def login():
         else:
             flash('Invalid username or password!')
     
-    return render_template('login.html')
+    return render_cache.page('login.html')
 
 @app.route('/logout')
 def logout():
@@ -191,7 +288,7 @@ def dashboard():
         return redirect(url_for('login'))
     
     # Get user balance
-    conn = sqlite3.connect('stocker.db')
+    conn = get_db(session['user_id'])
     cursor = conn.cursor()
     cursor.execute('SELECT balance FROM users WHERE id = ?', (session['user_id'],))
     balance = cursor.fetchone()[0]
@@ -200,8 +297,19 @@ def dashboard():
     # Get portfolio value
     _, portfolio_value = get_user_portfolio(session['user_id'])
     
+    # Price-dependent markup is identical for every user within one tick
+    virtual = len(STOCKS) > VIRTUAL_GRID_THRESHOLD
+    stock_grid = render_cache.fragment('stock_grid', price_version,
+                                       'stock_grid.html', stocks=STOCKS, virtual=virtual)
+    # Options only list names, so they change with the universe rather than prices;
+    # large universes are searched through /api/symbols/search instead
+    stock_options = '' if virtual else render_cache.fragment('stock_options', len(STOCKS),
+                                                             'stock_options.html', stocks=STOCKS)
+    
     return render_template('dashboard.html', 
-                         stocks=STOCKS, 
+                         stock_grid=stock_grid,
+                         stock_options=stock_options,
+                         stock_count=len(STOCKS),
                          balance=balance, 
                          portfolio_value=portfolio_value)
 
@@ -216,8 +324,10 @@ def trade(symbol):
     
     stock = STOCKS[symbol]
     stock['symbol'] = symbol
+    stock_card = render_cache.fragment(f'stock_card:{symbol}', price_version,
+                                       'stock_card.html', symbol=symbol, stock=stock)
     
-    return render_template('trade.html', stock=stock)
+    return render_template('trade.html', stock=stock, stock_card=stock_card)
 
 @app.route('/execute_trade', methods=['POST'])
 def execute_trade():
@@ -233,75 +343,50 @@ def execute_trade():
         return redirect(url_for('dashboard'))
     
     current_price = STOCKS[symbol]['price']
-    total_cost = quantity * current_price
     
-    conn = sqlite3.connect('stocker.db')
+    conn = get_db(session['user_id'])
     cursor = conn.cursor()
     
     try:
         # Get current balance
-        cursor.execute('SELECT balance FROM users WHERE id = ?', (session['user_id'],))
-        balance = cursor.fetchone()[0]
+        cursor.execute('SELECT balance, status FROM users WHERE id = ?', (session['user_id'],))
+        balance, status = cursor.fetchone()
         
-        if action == 'buy':
-            if balance < total_cost:
-                flash('Insufficient balance!')
-                return redirect(url_for('trade', symbol=symbol))
-            
-            # Update balance
-            new_balance = balance - total_cost
-            cursor.execute('UPDATE users SET balance = ? WHERE id = ?', 
-                         (new_balance, session['user_id']))
-            
-            # Update portfolio
+        if status != jobs.ACTIVE:
+            flash('This account is not active!')
+            return redirect(url_for('dashboard'))
+        
+        cursor.execute('''
+            SELECT quantity, avg_price FROM portfolio 
+            WHERE user_id = ? AND symbol = ?
+        ''', (session['user_id'], symbol))
+        existing = cursor.fetchone()
+        
+        try:
+            new_balance, holding, total_cost = fills.fill(balance, existing, action, quantity, current_price)
+        except fills.OrderRejected as e:
+            flash(str(e))
+            return redirect(url_for('trade', symbol=symbol))
+        
+        # Update balance
+        cursor.execute('UPDATE users SET balance = ? WHERE id = ?', 
+                     (new_balance, session['user_id']))
+        
+        # Update portfolio
+        if holding is None:
             cursor.execute('''
-                SELECT quantity, avg_price FROM portfolio 
-                WHERE user_id = ? AND symbol = ?
+                DELETE FROM portfolio WHERE user_id = ? AND symbol = ?
             ''', (session['user_id'], symbol))
-            existing = cursor.fetchone()
-            
-            if existing:
-                old_quantity, old_avg_price = existing
-                new_quantity = old_quantity + quantity
-                new_avg_price = ((old_quantity * old_avg_price) + (quantity * current_price)) / new_quantity
-                cursor.execute('''
-                    UPDATE portfolio SET quantity = ?, avg_price = ?
-                    WHERE user_id = ? AND symbol = ?
-                ''', (new_quantity, new_avg_price, session['user_id'], symbol))
-            else:
-                cursor.execute('''
-                    INSERT INTO portfolio (user_id, symbol, quantity, avg_price)
-                    VALUES (?, ?, ?, ?)
-                ''', (session['user_id'], symbol, quantity, current_price))
-        
-        else:  # sell
-            # Check if user has enough shares
+        elif existing:
             cursor.execute('''
-                SELECT quantity FROM portfolio 
+                UPDATE portfolio SET quantity = ?, avg_price = ?
                 WHERE user_id = ? AND symbol = ?
-            ''', (session['user_id'], symbol))
-            existing = cursor.fetchone()
-            
-            if not existing or existing[0] < quantity:
-                flash('Insufficient shares!')
-                return redirect(url_for('trade', symbol=symbol))
-            
-            # Update balance
-            new_balance = balance + total_cost
-            cursor.execute('UPDATE users SET balance = ? WHERE id = ?', 
-                         (new_balance, session['user_id']))
-            
-            # Update portfolio
-            new_quantity = existing[0] - quantity
-            if new_quantity == 0:
-                cursor.execute('''
-                    DELETE FROM portfolio WHERE user_id = ? AND symbol = ?
-                ''', (session['user_id'], symbol))
-            else:
-                cursor.execute('''
-                    UPDATE portfolio SET quantity = ?
-                    WHERE user_id = ? AND symbol = ?
-                ''', (new_quantity, session['user_id'], symbol))
+            ''', (holding[0], holding[1], session['user_id'], symbol))
+        else:
+            cursor.execute('''
+                INSERT INTO portfolio (user_id, symbol, quantity, avg_price)
+                VALUES (?, ?, ?, ?)
+            ''', (session['user_id'], symbol, holding[0], holding[1]))
         
         # Record trade
         cursor.execute('''
@@ -310,10 +395,13 @@ def execute_trade():
         ''', (session['user_id'], symbol, action, quantity, current_price, total_cost))
         
         conn.commit()
+        analytics.invalidate(session['user_id'])
         flash(f'Successfully {action} {quantity} shares of {symbol}!')
         
     except Exception as e:
         conn.rollback()
+        metrics.count_error()
+        app.logger.exception('Trade execution failed for user %s', session['user_id'])
         flash('Trade execution failed!')
     finally:
         conn.close()
@@ -328,7 +416,7 @@ def portfolio():
     portfolio_data, portfolio_value = get_user_portfolio(session['user_id'])
     
     # Get balance
-    conn = sqlite3.connect('stocker.db')
+    conn = get_db(session['user_id'])
     cursor = conn.cursor()
     cursor.execute('SELECT balance FROM users WHERE id = ?', (session['user_id'],))
     balance = cursor.fetchone()[0]
@@ -336,28 +424,49 @@ def portfolio():
     
     total_value = balance + portfolio_value
     
+    # Get performance and risk metrics
+    stats = analytics.get_user_analytics(session['user_id'], STOCKS, get_db, archived_trades)
+    
     return render_template('portfolio.html', 
                          portfolio=portfolio_data,
                          balance=balance,
                          portfolio_value=portfolio_value,
-                         total_value=total_value)
+                         total_value=total_value,
+                         analytics=stats)
 
 @app.route('/history')
 def history():
     if 'user_id' not in session:
         return redirect(url_for('login'))
     
-    conn = sqlite3.connect('stocker.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT symbol, action, quantity, price, total, timestamp
-        FROM trades WHERE user_id = ?
-        ORDER BY timestamp DESC
-    ''', (session['user_id'],))
-    trades = cursor.fetchall()
-    conn.close()
+    start, end = parse_date_range(request.args)
+    trades = get_user_trades(session['user_id'], start, end)
+    archived_through = archive.high_water(sharding.shard_for(session['user_id']))
+    
+    # The date filter and CSV export only exist here, not in aws_app
+    return render_template('history.html', trades=trades,
+                         start=request.args.get('start', ''),
+                         end=request.args.get('end', ''),
+                         export_url=url_for('export_history', start=request.args.get('start', ''),
+                                            end=request.args.get('end', '')),
+                         archived_through=archived_through and archived_through[:10])
+
+@app.route('/history/export')
+def export_history():
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    
+    start, end = parse_date_range(request.args)
+    trades = get_user_trades(session['user_id'], start, end)
+    
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(['timestamp', 'symbol', 'action', 'quantity', 'price', 'total'])
+    for symbol, action, quantity, price, total, timestamp in trades:
+        writer.writerow([timestamp, symbol, action, quantity, price, total])
     
-    return render_template('history.html', trades=trades)
+    return Response(output.getvalue(), mimetype='text/csv',
+                    headers={'Content-Disposition': 'attachment; filename=trades.csv'})
 
 # Admin routes
 @app.route('/admin/dashboard')
@@ -366,23 +475,33 @@ def admin_dashboard():
         flash('Access denied! Admin privileges required.')
         return redirect(url_for('login'))
     
-    conn = sqlite3.connect('stocker.db')
-    cursor = conn.cursor()
-    
-    # Get stats
-    cursor.execute('SELECT COUNT(*) FROM users WHERE role = "trader"')
-    total_users = cursor.fetchone()[0]
-    
-    cursor.execute('SELECT COUNT(*) FROM trades')
-    total_trades = cursor.fetchone()[0]
-    
-    cursor.execute('SELECT SUM(total) FROM trades WHERE action = "buy"')
-    total_volume = cursor.fetchone()[0] or 0
+    def shard_stats(conn):
+        cursor = conn.cursor()
+        
+        # Get stats
+        cursor.execute('SELECT COUNT(*) FROM users WHERE role = "trader"')
+        total_users = cursor.fetchone()[0]
+        
+        cursor.execute('SELECT COUNT(*) FROM trades')
+        total_trades = cursor.fetchone()[0]
+        
+        cursor.execute('SELECT SUM(total) FROM trades WHERE action = "buy"')
+        total_volume = cursor.fetchone()[0] or 0
+        
+        cursor.execute('SELECT SUM(balance) FROM users')
+        total_cash = cursor.fetchone()[0] or 0
+        
+        return total_users, total_trades, total_volume, total_cash
     
-    cursor.execute('SELECT SUM(balance) FROM users')
-    total_cash = cursor.fetchone()[0] or 0
+    # Query every shard in parallel and add up the results
+    results = sharding.scatter(shard_stats, connect=read_db)
+    total_users, total_trades, total_volume, total_cash = (sum(column) for column in zip(*results))
     
-    conn.close()
+    # Trades moved to the archive still count
+    for shard in range(sharding.SHARD_COUNT):
+        archived_trades_count, archived_volume = archive.totals(shard)
+        total_trades += archived_trades_count
+        total_volume += archived_volume
     
     return render_template('admin_dashboard.html', 
                          total_users=total_users,
@@ -396,17 +515,20 @@ def admin_portfolio():
         flash('Access denied! Admin privileges required.')
         return redirect(url_for('login'))
     
-    conn = sqlite3.connect('stocker.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT u.username, p.symbol, p.quantity, p.avg_price, u.balance
-        FROM portfolio p
-        JOIN users u ON p.user_id = u.id
-        WHERE p.quantity > 0
-        ORDER BY u.username, p.symbol
-    ''')
-    portfolios = cursor.fetchall()
-    conn.close()
+    def shard_portfolios(conn):
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT u.username, p.symbol, p.quantity, p.avg_price, u.balance
+            FROM portfolio p
+            JOIN users u ON p.user_id = u.id
+            WHERE p.quantity > 0
+            ORDER BY u.username, p.symbol
+        ''')
+        return cursor.fetchall()
+    
+    # Each shard returns sorted rows; merge them into one ordered list
+    results = sharding.scatter(shard_portfolios, connect=read_db)
+    portfolios = list(heapq.merge(*results, key=lambda row: (row[0], row[1])))
     
     return render_template('admin_portfolio.html', portfolios=portfolios, stocks=STOCKS)
 
@@ -416,17 +538,20 @@ def admin_history():
         flash('Access denied! Admin privileges required.')
         return redirect(url_for('login'))
     
-    conn = sqlite3.connect('stocker.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT u.username, t.symbol, t.action, t.quantity, t.price, t.total, t.timestamp
-        FROM trades t
-        JOIN users u ON t.user_id = u.id
-        ORDER BY t.timestamp DESC
-        LIMIT 100
-    ''')
-    trades = cursor.fetchall()
-    conn.close()
+    def shard_trades(conn):
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT u.username, t.symbol, t.action, t.quantity, t.price, t.total, t.timestamp
+            FROM trades t
+            JOIN users u ON t.user_id = u.id
+            ORDER BY t.timestamp DESC
+            LIMIT 100
+        ''')
+        return cursor.fetchall()
+    
+    # Latest 100 per shard, merged into the latest 100 overall
+    results = sharding.scatter(shard_trades, connect=read_db)
+    trades = list(heapq.merge(*results, key=lambda row: row[6], reverse=True))[:100]
     
     return render_template('admin_history.html', trades=trades)
 
@@ -436,64 +561,132 @@ def admin_manage():
         flash('Access denied! Admin privileges required.')
         return redirect(url_for('login'))
     
-    conn = sqlite3.connect('stocker.db')
-    cursor = conn.cursor()
-    cursor.execute('''
-        SELECT id, username, email, balance, role, created_at
-        FROM users
-        ORDER BY created_at DESC
-    ''')
-    users = cursor.fetchall()
-    conn.close()
+    def shard_users(conn):
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, username, email, balance, role, created_at, status
+            FROM users
+            ORDER BY created_at DESC
+        ''')
+        return cursor.fetchall()
+    
+    results = sharding.scatter(shard_users, connect=read_db)
+    users = list(heapq.merge(*results, key=lambda row: row[5], reverse=True))
     
-    return render_template('admin_manage.html', users=users)
+    return render_template('admin_manage.html', users=users, user_jobs=jobs.by_user())
 
 @app.route('/admin/users/<int:user_id>', methods=['DELETE'])
 def delete_user(user_id):
     if 'user_id' not in session or session.get('role') != 'admin':
         return jsonify({'error': 'Unauthorized'}), 401
     
-    conn = sqlite3.connect('stocker.db')
-    cursor = conn.cursor()
+    # Lock the user out now; their rows are removed in chunks in the background
+    if not jobs.set_status(user_id, jobs.DELETING):
+        return jsonify({'error': 'User not found or busy'}), 409
     
-    try:
-        # Delete user's portfolio
-        cursor.execute('DELETE FROM portfolio WHERE user_id = ?', (user_id,))
-        # Delete user's trades
-        cursor.execute('DELETE FROM trades WHERE user_id = ?', (user_id,))
-        # Delete user
-        cursor.execute('DELETE FROM users WHERE id = ?', (user_id,))
-        conn.commit()
-        return jsonify({'success': True})
-    except Exception as e:
-        conn.rollback()
-        return jsonify({'error': str(e)}), 500
-    finally:
-        conn.close()
+    job = jobs.submit('delete', user_id)
+    return jsonify({'success': True, 'job': job}), 202
 
 @app.route('/admin/users/<int:user_id>/suspend', methods=['POST'])
 def suspend_user(user_id):
     if 'user_id' not in session or session.get('role') != 'admin':
         return jsonify({'error': 'Unauthorized'}), 401
     
-    # This would implement user suspension logic
-    # For now, just return success
+    if not jobs.set_status(user_id, jobs.SUSPENDED, allowed=(jobs.ACTIVE,)):
+        return jsonify({'error': 'User not found or not active'}), 409
     return jsonify({'success': True})
 
+@app.route('/admin/users/<int:user_id>/activate', methods=['POST'])
+def activate_user(user_id):
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    if not jobs.set_status(user_id, jobs.ACTIVE, allowed=(jobs.SUSPENDED,)):
+        return jsonify({'error': 'User not found or not suspended'}), 409
+    return jsonify({'success': True})
+
+@app.route('/admin/users/<int:user_id>/reset', methods=['POST'])
+def reset_user(user_id):
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    # Clears holdings and trades and restores the starting balance
+    if not jobs.set_status(user_id, jobs.RESETTING, allowed=(jobs.ACTIVE,)):
+        return jsonify({'error': 'User not found or not active'}), 409
+    
+    job = jobs.submit('reset', user_id)
+    return jsonify({'success': True, 'job': job}), 202
+
+@app.route('/admin/jobs')
+def admin_jobs():
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    return jsonify(jobs.all_jobs())
+
+@app.route('/admin/jobs/<int:job_id>')
+def admin_job(job_id):
+    if 'user_id' not in session or session.get('role') != 'admin':
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Not found'}), 404
+    return jsonify(job)
+
+def save_prices_snapshot():
+    # Closing prices for statements.py; at most once per interval, the tick is on a request
+    global prices_saved_at
+    now = time.monotonic()
+    if prices_saved_at is not None and now - prices_saved_at < PRICES_SNAPSHOT_INTERVAL:
+        return
+    prices_saved_at = now
+    try:
+        symbols.save_csv(symbols.PRICES_SNAPSHOT, STOCKS)
+    except OSError as e:
+        print(f"Saving price snapshot failed: {e}")
+
 # API routes for live updates
 @app.route('/api/stocks')
+@admission.polling(shared=True)
 def api_stocks():
-    # Simulate price changes
+    global price_version
+    
+    # Simulate price changes; concurrent polls share one tick via admission.polling
+    tick_start = time.perf_counter()
     for symbol in STOCKS:
         change_percent = random.uniform(-0.02, 0.02)  # -2% to +2%
         STOCKS[symbol]['price'] *= (1 + change_percent)
         STOCKS[symbol]['change'] = STOCKS[symbol]['price'] * change_percent
         STOCKS[symbol]['price'] = round(STOCKS[symbol]['price'], 2)
         STOCKS[symbol]['change'] = round(STOCKS[symbol]['change'], 2)
+    price_version += 1
+    analytics.record_tick(STOCKS)
+    save_prices_snapshot()
+    metrics.price_tick.observe(time.perf_counter() - tick_start)
     
     return jsonify(STOCKS)
 
+@app.route('/api/symbols')
+def api_symbols():
+    # Cursor-paginated listing in ticker order: ?after=<last symbol>&limit=50
+    limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+    page, next_cursor = symbols.get_index(STOCKS).page(request.args.get('after'), limit)
+    return jsonify({
+        'symbols': [dict(STOCKS[symbol], symbol=symbol) for symbol in page],
+        'next': next_cursor,
+        'total': len(STOCKS)
+    })
+
+@app.route('/api/symbols/search')
+def api_symbols_search():
+    # Ticker and company name prefix search for autocomplete: ?q=app&limit=20
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    matches = symbols.get_index(STOCKS).search(request.args.get('q', ''), limit)
+    return jsonify([dict(STOCKS[symbol], symbol=symbol) for symbol in matches])
+
 @app.route('/api/portfolio/<int:user_id>')
+@admission.polling()
 def api_portfolio(user_id):
     if 'user_id' not in session:
         return jsonify({'error': 'Unauthorized'}), 401
@@ -508,6 +701,52 @@ def api_portfolio(user_id):
         'portfolio_value': portfolio_value
     })
 
+@app.route('/api/analytics/<int:user_id>')
+def api_analytics(user_id):
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    # Users can only access their own analytics, admins can access any
+    if session.get('role') != 'admin' and session['user_id'] != user_id:
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    return jsonify(analytics.get_user_analytics(user_id, STOCKS, get_db, archived_trades))
+
+@app.context_processor
+def inject_replica_status():
+    return {'replica_enabled': replica.ENABLED, 'replica_age': replica.age()}
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+metrics.register_gauge('stocker_render_cache_hit_ratio', 'Rendering cache hit ratio',
+                       lambda: metrics.hit_rate(render_cache.stats))
+metrics.register_gauge('stocker_analytics_cache_hit_ratio', 'Portfolio analytics cache hit ratio',
+                       lambda: metrics.hit_rate(analytics.stats))
+metrics.register_gauge('stocker_jobs_pending', 'Admin background jobs queued or running',
+                       jobs.pending)
+metrics.register_gauge('stocker_requests_in_flight', 'Requests currently being handled',
+                       admission.in_flight)
+metrics.register_gauge('stocker_poll_coalesced_total', 'Polling requests answered by an identical in-flight request',
+                       lambda: admission.stats['coalesced'], 'counter')
+metrics.register_gauge('stocker_poll_rate_limited_total', 'Polling requests over the per-session rate limit',
+                       lambda: admission.stats['rate_limited'], 'counter')
+metrics.register_gauge('stocker_poll_shed_total', 'Polling requests answered from the last snapshot under load',
+                       lambda: admission.stats['shed'], 'counter')
+metrics.register_gauge('stocker_password_hashes_total', 'scrypt hashes computed for logins and sign-ups',
+                       lambda: passwords.stats['hashes'], 'counter')
+metrics.register_gauge('stocker_password_rehashed_total', 'Stored password hashes upgraded at login',
+                       lambda: passwords.stats['rehashed'], 'counter')
+metrics.register_gauge('stocker_password_busy_total', 'Logins and sign-ups refused with the hash queue full',
+                       lambda: passwords.stats['busy'], 'counter')
+metrics.register_gauge('stocker_replica_age_seconds', 'Age of the admin read replica snapshot',
+                       lambda: replica.age() or 0)
+
 if __name__ == '__main__':
     init_db()
+    jobs.resume()
+    passwords.start()
+    if replica.ENABLED:
+        replica.start(sharding.all_paths())
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
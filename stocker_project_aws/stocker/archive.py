@@ -0,0 +1,344 @@
+"""Hot/cold tiering for the trades table
+
+Trades older than the horizon are moved out of each shard's trades table into
+compressed, columnar archive files partitioned by month:
+
+    archive/<shard>/trades-YYYY-MM.npz
+
+Each partition stores one array per column, sorted by user and time so a
+user's trades are a contiguous slice. Symbols and actions are dictionary
+encoded. Archive files are written before the hot rows are deleted and
+merging deduplicates by trade id, so an interrupted run is safe to repeat.
+
+Each shard's archive also records its high-water mark, the newest archived
+timestamp, in archive/<shard>/high-water. Readers compare a range against
+it rather than against the horizon, which a run may have overridden.
+
+    python archive.py                  # archive trades older than the horizon
+    python archive.py --horizon-days 30
+"""
+import argparse
+import contextlib
+import fcntl
+import functools
+import os
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import sharding
+
+ARCHIVE_DIR = os.environ.get('STOCKER_ARCHIVE_DIR', 'archive')
+HORIZON_DAYS = int(os.environ.get('STOCKER_ARCHIVE_HORIZON_DAYS', 90))
+BATCH_SIZE = 50000
+DELETE_CHUNK = 500
+
+COLUMNS = ('id', 'user_id', 'symbol', 'action', 'quantity', 'price', 'total', 'timestamp')
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+HIGH_WATER_FILE = 'high-water'
+LOCK_FILE = '.lock'
+
+
+def cutoff(horizon_days=None):
+    """Timestamp before which trades belong in the archive"""
+    days = HORIZON_DAYS if horizon_days is None else horizon_days
+    return (datetime.utcnow() - timedelta(days=days)).strftime(TIMESTAMP_FORMAT)
+
+
+def partition_dir(shard_path):
+    return os.path.join(ARCHIVE_DIR, os.path.splitext(os.path.basename(shard_path))[0])
+
+
+def high_water(shard):
+    """Newest timestamp ever archived for a shard, or None if nothing was"""
+    directory = partition_dir(sharding.shard_path(shard))
+    try:
+        with open(os.path.join(directory, HIGH_WATER_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        pass
+
+    # Archives written before the mark was recorded: take it from the newest partition
+    if not os.path.isdir(directory):
+        return None
+    with _locked(directory):
+        names = sorted(name for name in os.listdir(directory) if name.startswith('trades-') and name.endswith('.npz'))
+        if not names:
+            return None
+        newest = load_partition(os.path.join(directory, names[-1]))['timestamp'].max()
+        mark = str(np.datetime_as_string(newest, unit='s')).replace('T', ' ')
+        _raise_high_water(directory, mark)
+    return mark
+
+
+@contextlib.contextmanager
+def _locked(directory):
+    """Hold a shard archive's lock while its files are read, rewritten and replaced
+
+    An exclusive flock, so archive runs, user deletions and moves in any
+    process take turns; readers need no lock as files are replaced atomically.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with open(os.path.join(directory, LOCK_FILE), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _raise_high_water(directory, timestamp):
+    path = os.path.join(directory, HIGH_WATER_FILE)
+    try:
+        with open(path) as f:
+            if f.read().strip() >= timestamp:
+                return
+    except FileNotFoundError:
+        pass
+    with open(path + '.tmp', 'w') as f:
+        f.write(timestamp)
+    os.replace(path + '.tmp', path)
+
+
+def reaches_archive(shard, start=None):
+    """Whether trades from start on (None: all of them) may be in a shard's archive"""
+    mark = high_water(shard)
+    return mark is not None and (start is None or start <= mark)
+
+
+def _encode(rows):
+    ids, user_ids, symbols, actions, quantities, prices, totals, timestamps = zip(*rows)
+    symbol_names, symbol_codes = np.unique(np.array(symbols, dtype=str), return_inverse=True)
+    action_names, action_codes = np.unique(np.array(actions, dtype=str), return_inverse=True)
+    columns = {
+        'id': np.array(ids, dtype=np.int64),
+        'user_id': np.array(user_ids, dtype=np.int64),
+        'symbol_names': symbol_names,
+        'symbol': symbol_codes.astype(np.int32),
+        'action_names': action_names,
+        'action': action_codes.astype(np.int8),
+        'quantity': np.array(quantities, dtype=np.int64),
+        'price': np.array(prices, dtype=np.float64),
+        'total': np.array(totals, dtype=np.float64),
+        'timestamp': np.array(timestamps, dtype='datetime64[s]'),
+    }
+    order = np.lexsort((columns['id'], columns['timestamp'], columns['user_id']))
+    for name in ('id', 'user_id', 'symbol', 'action', 'quantity', 'price', 'total', 'timestamp'):
+        columns[name] = columns[name][order]
+    return columns
+
+
+def _decode(columns, start=0, stop=None):
+    """Rows in trades table column order for a slice of a partition"""
+    window = slice(start, stop)
+    timestamps = np.datetime_as_string(columns['timestamp'][window], unit='s')
+    return list(zip(
+        columns['id'][window].tolist(),
+        columns['user_id'][window].tolist(),
+        columns['symbol_names'][columns['symbol'][window]].tolist(),
+        columns['action_names'][columns['action'][window]].tolist(),
+        columns['quantity'][window].tolist(),
+        columns['price'][window].tolist(),
+        columns['total'][window].tolist(),
+        [ts.replace('T', ' ') for ts in timestamps],
+    ))
+
+
+@functools.lru_cache(maxsize=32)
+def _load(path, mtime):
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def load_partition(path):
+    return _load(path, os.path.getmtime(path))
+
+
+def _merge(directory, rows):
+    """Merge rows into a shard archive's monthly partitions and raise its high-water mark"""
+    partitions = {}
+    for row in rows:
+        partitions.setdefault(row[7][:7], []).append(row)
+    with _locked(directory):
+        for month, month_rows in partitions.items():
+            _write_partition(os.path.join(directory, f'trades-{month}.npz'), month_rows)
+        _raise_high_water(directory, max(row[7] for row in rows))
+
+
+def _write_partition(path, rows):
+    """Merge rows into a partition file, replacing it atomically; the caller holds the lock"""
+    if os.path.exists(path):
+        existing = _decode(load_partition(path))
+        # Trade ids are per shard, so a user moved in from another shard may reuse one
+        seen = {(row[0], row[1]) for row in rows}
+        rows = rows + [row for row in existing if (row[0], row[1]) not in seen]
+    _save_partition(path, rows)
+
+
+def _save_partition(path, rows):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez_compressed(f, **_encode(rows))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def archive_shard(shard, before):
+    """Move trades older than `before` from one shard into its archive"""
+    shard_path = sharding.shard_path(shard)
+    directory = partition_dir(shard_path)
+    os.makedirs(directory, exist_ok=True)
+
+    moved = 0
+    conn = sharding.connect_shard(shard)
+    try:
+        while True:
+            cursor = conn.cursor()
+            cursor.execute(f'''
+                SELECT {', '.join(COLUMNS)} FROM trades
+                WHERE timestamp < ?
+                ORDER BY id
+                LIMIT ?
+            ''', (before, BATCH_SIZE))
+            rows = cursor.fetchall()
+            if not rows:
+                break
+
+            # The high-water mark is raised before the hot rows go, so readers never miss them
+            _merge(directory, rows)
+
+            # Small committed deletes keep the write lock short for traders
+            ids = [row[0] for row in rows]
+            for i in range(0, len(ids), DELETE_CHUNK):
+                chunk = ids[i:i + DELETE_CHUNK]
+                marks = ', '.join('?' * len(chunk))
+                conn.execute(f'DELETE FROM trades WHERE id IN ({marks})', chunk)
+                conn.commit()
+            moved += len(rows)
+    finally:
+        conn.close()
+    return moved
+
+
+def archive_all(horizon_days=None):
+    """Archive old trades on every shard; returns the number of trades moved"""
+    before = cutoff(horizon_days)
+    return sum(archive_shard(shard, before) for shard in range(sharding.SHARD_COUNT))
+
+
+def read_trades(shard, user_id=None, start=None, end=None):
+    """Archived trades for a shard, optionally for one user and a timestamp range
+
+    start and end are timestamp strings compared as in SQL (start <= ts <= end).
+    Partitions outside the range are skipped without being opened.
+    """
+    directory = partition_dir(sharding.shard_path(shard))
+    if not os.path.isdir(directory):
+        return []
+
+    rows = []
+    for name in sorted(os.listdir(directory)):
+        if not (name.startswith('trades-') and name.endswith('.npz')):
+            continue
+        month = name[len('trades-'):-len('.npz')]
+        if (start and month < start[:7]) or (end and month > end[:7]):
+            continue
+
+        try:
+            columns = load_partition(os.path.join(directory, name))
+        except FileNotFoundError:
+            # Emptied and removed by purge_user since the listing
+            continue
+        lo, hi = 0, len(columns['id'])
+        if user_id is not None:
+            lo = int(np.searchsorted(columns['user_id'], user_id, side='left'))
+            hi = int(np.searchsorted(columns['user_id'], user_id, side='right'))
+        for row in _decode(columns, lo, hi):
+            if (start and row[7] < start) or (end and row[7] > end):
+                continue
+            rows.append(row)
+    return rows
+
+
+@functools.lru_cache(maxsize=256)
+def _partition_totals(path, mtime):
+    columns = _load(path, mtime)
+    actions = columns['action_names'].tolist()
+    volume = columns['total'][columns['action'] == actions.index('buy')].sum() if 'buy' in actions else 0.0
+    return len(columns['id']), float(volume)
+
+
+def totals(shard):
+    """(trade count, buy volume) of a shard's archive"""
+    directory = partition_dir(sharding.shard_path(shard))
+    if not os.path.isdir(directory):
+        return 0, 0.0
+
+    count, volume = 0, 0.0
+    for name in os.listdir(directory):
+        if not (name.startswith('trades-') and name.endswith('.npz')):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            partition_count, partition_volume = _partition_totals(path, os.path.getmtime(path))
+        except FileNotFoundError:
+            continue
+        count += partition_count
+        volume += partition_volume
+    return count, volume
+
+
+def purge_user(shard, user_id):
+    """Remove a user's archived trades, e.g. when the user is deleted"""
+    directory = partition_dir(sharding.shard_path(shard))
+    if not os.path.isdir(directory):
+        return 0
+
+    removed = 0
+    with _locked(directory):
+        for name in sorted(os.listdir(directory)):
+            if not (name.startswith('trades-') and name.endswith('.npz')):
+                continue
+            path = os.path.join(directory, name)
+            columns = load_partition(path)
+            lo = int(np.searchsorted(columns['user_id'], user_id, side='left'))
+            hi = int(np.searchsorted(columns['user_id'], user_id, side='right'))
+            if lo == hi:
+                continue
+
+            rows = _decode(columns, 0, lo) + _decode(columns, hi)
+            if rows:
+                _save_partition(path, rows)
+            else:
+                os.remove(path)
+            removed += hi - lo
+    return removed
+
+
+def move_user(user_id, source_shard, target_shard):
+    """Copy a user's archived trades to another shard's archive; returns the number copied
+
+    Merging deduplicates, so a move interrupted before purge_user() on the
+    source can be repeated.
+    """
+    rows = read_trades(source_shard, user_id)
+    if not rows:
+        return 0
+    _merge(partition_dir(sharding.shard_path(target_shard)), rows)
+    return len(rows)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Move old trades into the compressed archive')
+    parser.add_argument('--horizon-days', type=int, default=HORIZON_DAYS)
+    args = parser.parse_args(argv)
+
+    moved = archive_all(args.horizon_days)
+    print(f'Archived {moved} trades older than {cutoff(args.horizon_days)} into {ARCHIVE_DIR}/')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,179 @@
+"""Fingerprinted, pre-compressed static bundles
+
+styles.css and script.js are minified, named after a hash of their content
+(styles.3f2a9c0d1e4b.css) and compressed once with gzip, plus brotli when
+the brotli package is installed. Templates link them with asset_url(), and
+/assets/ serves the best encoding the browser accepts with a one-year
+immutable Cache-Control: a changed file gets a new name, so browsers
+never need to revalidate.
+
+Bundles are built in memory when the app starts; in debug mode they are
+rebuilt when a source file changes. A rebuild drops the render cache so
+cached pages link the new bundles, and superseded bundles are still served
+for pages rendered before it. `python assets.py` writes the same files and
+a manifest.json to static/dist/ for a CDN or a proxy serving pre-compressed
+files.
+"""
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+
+from flask import Response, abort, request, url_for
+
+import render_cache
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+BUNDLES = ('styles.css', 'script.js')
+MAX_AGE = 365 * 24 * 3600
+
+MIMETYPES = {'.css': 'text/css', '.js': 'text/javascript'}
+
+_lock = threading.Lock()
+# Source name -> Bundle for the last build, and the source mtimes it was built from
+_current = None
+_built_mtimes = None
+# Filename -> Bundle for every build since start, so older pages still load
+_by_filename = {}
+
+
+def minify_css(source):
+    source = re.sub(r'/\*.*?\*/', '', source, flags=re.S)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    source = re.sub(r':\s+', ':', source)
+    return source.replace(';}', '}').strip()
+
+
+def minify_js(source):
+    # Only indentation, blank lines and whole-line comments go; line breaks stay for ASI
+    lines = (line.strip() for line in source.splitlines())
+    return '\n'.join(line for line in lines if line and not line.startswith('//')) + '\n'
+
+
+MINIFIERS = {'.css': minify_css, '.js': minify_js}
+
+
+class Bundle:
+    """One minified asset with its encodings"""
+
+    def __init__(self, name, source):
+        base, ext = os.path.splitext(name)
+        self.body = MINIFIERS[ext](source).encode()
+        self.digest = hashlib.sha256(self.body).hexdigest()[:12]
+        self.filename = f'{base}.{self.digest}{ext}'
+        self.mimetype = MIMETYPES[ext]
+        self.encodings = {'gzip': gzip.compress(self.body, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            self.encodings['br'] = brotli.compress(self.body, quality=11)
+
+
+def _mtimes():
+    return tuple(os.stat(os.path.join(STATIC_DIR, name)).st_mtime_ns for name in BUNDLES)
+
+
+def rebuild():
+    """Build the bundles again if a source file changed; returns source name -> Bundle"""
+    global _current, _built_mtimes
+    mtimes = _mtimes()
+    with _lock:
+        if mtimes == _built_mtimes:
+            return _current
+        built = {}
+        for name in BUNDLES:
+            with open(os.path.join(STATIC_DIR, name), encoding='utf-8') as f:
+                built[name] = Bundle(name, f.read())
+        changed = _current is not None
+        for bundle in built.values():
+            _by_filename[bundle.filename] = bundle
+        _current, _built_mtimes = built, mtimes
+    if changed:
+        # Cached pages link the old bundle names
+        render_cache.clear()
+    return built
+
+
+def bundles():
+    """Source name -> Bundle, built on first use"""
+    if _current is None:
+        return rebuild()
+    return _current
+
+
+def asset_url(name):
+    """URL of an asset's fingerprinted bundle, or of the plain file if it is not bundled"""
+    bundle = bundles().get(name)
+    if bundle is None:
+        return url_for('static', filename=name)
+    return url_for('asset', filename=bundle.filename)
+
+
+def _serve(filename):
+    bundles()
+    bundle = _by_filename.get(filename)
+    if bundle is None:
+        abort(404)
+
+    body, encoding = bundle.body, None
+    for candidate in ('br', 'gzip'):
+        if candidate in bundle.encodings and request.accept_encodings[candidate]:
+            body, encoding = bundle.encodings[candidate], candidate
+            break
+
+    response = Response(body, mimetype=bundle.mimetype)
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = f'public, max-age={MAX_AGE}, immutable'
+    response.set_etag(f'{bundle.digest}-{encoding or "identity"}')
+    return response.make_conditional(request)
+
+
+def init_app(app):
+    """Build the bundles and add the /assets/ route and the asset_url() template global"""
+    rebuild()
+    app.add_url_rule('/assets/<path:filename>', 'asset', _serve)
+    app.jinja_env.globals['asset_url'] = asset_url
+
+    @app.before_request
+    def reload_assets():
+        # Edited sources are picked up before any cached page is served
+        if app.debug:
+            rebuild()
+
+
+def build(out_dir=os.path.join(STATIC_DIR, 'dist')):
+    """Write every bundle and its encodings to out_dir, with a manifest of source -> bundle name"""
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = {}
+    for name, bundle in bundles().items():
+        manifest[name] = bundle.filename
+        path = os.path.join(out_dir, bundle.filename)
+        with open(path, 'wb') as f:
+            f.write(bundle.body)
+        for encoding, body in bundle.encodings.items():
+            with open(path + ('.br' if encoding == 'br' else '.gz'), 'wb') as f:
+                f.write(body)
+    with open(os.path.join(out_dir, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def main():
+    for name, bundle in bundles().items():
+        sizes = ', '.join(f'{encoding} {len(body)}' for encoding, body in bundle.encodings.items())
+        print(f'{name} -> {bundle.filename}: {len(bundle.body)} bytes ({sizes})')
+    build()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,128 +1,166 @@
-import boto3
-import hashlib
+import functools
+import os
 import random
 import json
+import threading
 from datetime import datetime, timedelta
 from decimal import Decimal
 from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash
 
+import admission
+import assets
+import passwords
+import render_cache
+import symbols
+
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-in-production'
+admission.init_app(app)
+assets.init_app(app)
 
 # AWS Configuration
-AWS_REGION = 'us-east-1'
-dynamodb = boto3.resource('dynamodb', region_name=AWS_REGION)
-sns = boto3.client('sns', region_name=AWS_REGION)
+AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
+# Point at DynamoDB Local or another stand-in, e.g. http://localhost:8000
+DYNAMODB_ENDPOINT = os.environ.get('STOCKER_DYNAMODB_ENDPOINT') or None
+# Skip the table existence check on startup when tables are provisioned separately
+SKIP_TABLE_CHECK = os.environ.get('STOCKER_SKIP_TABLE_CHECK', '').lower() in ('1', 'true', 'yes')
 
 # DynamoDB Tables
-users_table = dynamodb.Table('stocker_users')
-trades_table = dynamodb.Table('stocker_trades')
-portfolio_table = dynamodb.Table('stocker_portfolio')
+USERS_TABLE = 'stocker_users'
+TRADES_TABLE = 'stocker_trades'
+PORTFOLIO_TABLE = 'stocker_portfolio'
 
 # SNS Topic ARN (you'll need to create this in AWS)
 SNS_TOPIC_ARN = 'arn:aws:sns:us-east-1:YOUR-ACCOUNT-ID:stocker-notifications'
+# Verified SES sender for per-user statement emails
+STATEMENT_SENDER = os.environ.get('STOCKER_STATEMENT_SENDER', 'statements@example.com')
 
-# Sample stock data (same as local version)
-STOCKS = {
-    'AAPL': {'name': 'Apple Inc.', 'price': 185.50, 'change': 2.75},
-    'GOOGL': {'name': 'Alphabet Inc.', 'price': 142.30, 'change': -1.20},
-    'MSFT': {'name': 'Microsoft Corp.', 'price': 378.85, 'change': 4.60},
-    'AMZN': {'name': 'Amazon.com Inc.', 'price': 145.75, 'change': -2.85},
-    'TSLA': {'name': 'Tesla Inc.', 'price': 248.42, 'change': 8.90},
-    'META': {'name': 'Meta Platforms', 'price': 325.60, 'change': 5.25},
-    'NVDA': {'name': 'NVIDIA Corp.', 'price': 875.30, 'change': 12.40},
-    'NFLX': {'name': 'Netflix Inc.', 'price': 445.20, 'change': -3.75},
-    'ADBE': {'name': 'Adobe Inc.', 'price': 485.90, 'change': 6.80},
-    'CRM': {'name': 'Salesforce Inc.', 'price': 215.40, 'change': -1.95},
-    'ORCL': {'name': 'Oracle Corp.', 'price': 102.85, 'change': 1.30},
-    'IBM': {'name': 'IBM', 'price': 158.75, 'change': 0.85},
-    'INTC': {'name': 'Intel Corp.', 'price': 43.20, 'change': -0.60},
-    'AMD': {'name': 'AMD Inc.', 'price': 142.60, 'change': 3.45},
-    'UBER': {'name': 'Uber Technologies', 'price': 65.40, 'change': 2.10},
-    'LYFT': {'name': 'Lyft Inc.', 'price': 14.85, 'change': -0.35},
-    'SPOT': {'name': 'Spotify Technology', 'price': 185.20, 'change': 4.20},
-    'ZOOM': {'name': 'Zoom Video', 'price': 68.90, 'change': -1.15},
-    'SQ': {'name': 'Block Inc.', 'price': 78.35, 'change': 2.80},
-    'PYPL': {'name': 'PayPal Holdings', 'price': 62.45, 'change': -0.95},
-    'V': {'name': 'Visa Inc.', 'price': 245.70, 'change': 1.85},
-    'MA': {'name': 'Mastercard Inc.', 'price': 385.20, 'change': 3.60},
-    'JPM': {'name': 'JPMorgan Chase', 'price': 158.90, 'change': 2.25},
-    'GS': {'name': 'Goldman Sachs', 'price': 365.80, 'change': -1.40},
-    'WMT': {'name': 'Walmart Inc.', 'price': 158.25, 'change': 0.75},
-    'HD': {'name': 'Home Depot', 'price': 345.60, 'change': 4.15},
-    'PG': {'name': 'Procter & Gamble', 'price': 155.30, 'change': 0.90}
-}
+# Live prices for the symbol universe, from symbols.py
+STOCKS = symbols.load_stocks()
 
-def init_aws_tables():
-    """Initialize DynamoDB tables if they don't exist"""
+# Bumped on every price tick; keys the shared rendering cache
+price_version = 0
+
+# Above this many symbols the dashboard grid is rendered client-side, visible rows only
+VIRTUAL_GRID_THRESHOLD = int(os.environ.get('STOCKER_VIRTUAL_GRID_THRESHOLD', 200))
+
+# boto3 is imported and clients are built on first use, not at import time,
+# so cold starts only pay for the AWS services a request actually touches
+@functools.lru_cache(maxsize=None)
+def _session():
+    import boto3
+    return boto3.session.Session(region_name=AWS_REGION)
+
+@functools.lru_cache(maxsize=None)
+def get_dynamodb():
+    return _session().resource('dynamodb', endpoint_url=DYNAMODB_ENDPOINT)
+
+@functools.lru_cache(maxsize=None)
+def get_sns():
+    return _session().client('sns')
+
+@functools.lru_cache(maxsize=None)
+def get_ses():
+    return _session().client('ses')
+
+@functools.lru_cache(maxsize=None)
+def get_table(name):
+    return get_dynamodb().Table(name)
+
+def key(name):
+    from boto3.dynamodb.conditions import Key
+    return Key(name)
+
+def prewarm():
+    """Build clients and open a connection before the first request
+
+    Call from a serverless init handler or worker post-fork hook.
+    """
     try:
-        # Create users table
-        users_table = dynamodb.create_table(
-            TableName='stocker_users',
-            KeySchema=[
-                {'AttributeName': 'user_id', 'KeyType': 'HASH'}
-            ],
-            AttributeDefinitions=[
-                {'AttributeName': 'user_id', 'AttributeType': 'S'},
-                {'AttributeName': 'username', 'AttributeType': 'S'}
-            ],
-            GlobalSecondaryIndexes=[
-                {
-                    'IndexName': 'username-index',
-                    'KeySchema': [
-                        {'AttributeName': 'username', 'KeyType': 'HASH'}
-                    ],
-                    'Projection': {'ProjectionType': 'ALL'},
-                    'BillingMode': 'PAY_PER_REQUEST'
-                }
-            ],
-            BillingMode='PAY_PER_REQUEST'
-        )
-        
-        # Create trades table
-        trades_table = dynamodb.create_table(
-            TableName='stocker_trades',
-            KeySchema=[
-                {'AttributeName': 'trade_id', 'KeyType': 'HASH'}
-            ],
-            AttributeDefinitions=[
-                {'AttributeName': 'trade_id', 'AttributeType': 'S'},
-                {'AttributeName': 'user_id', 'AttributeType': 'S'}
-            ],
-            GlobalSecondaryIndexes=[
-                {
-                    'IndexName': 'user-index',
-                    'KeySchema': [
-                        {'AttributeName': 'user_id', 'KeyType': 'HASH'}
-                    ],
-                    'Projection': {'ProjectionType': 'ALL'},
-                    'BillingMode': 'PAY_PER_REQUEST'
-                }
-            ],
-            BillingMode='PAY_PER_REQUEST'
-        )
-        
-        # Create portfolio table
-        portfolio_table = dynamodb.create_table(
-            TableName='stocker_portfolio',
-            KeySchema=[
-                {'AttributeName': 'user_id', 'KeyType': 'HASH'},
-                {'AttributeName': 'symbol', 'KeyType': 'RANGE'}
-            ],
-            AttributeDefinitions=[
-                {'AttributeName': 'user_id', 'AttributeType': 'S'},
-                {'AttributeName': 'symbol', 'AttributeType': 'S'}
-            ],
-            BillingMode='PAY_PER_REQUEST'
-        )
-        
-        print("Tables created successfully")
-        
+        get_sns()
+        get_table(USERS_TABLE).load()
     except Exception as e:
-        print(f"Tables might already exist: {e}")
+        print(f"Prewarm failed: {e}")
 
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+TABLE_SCHEMAS = {
+    USERS_TABLE: {
+        'KeySchema': [
+            {'AttributeName': 'user_id', 'KeyType': 'HASH'}
+        ],
+        'AttributeDefinitions': [
+            {'AttributeName': 'user_id', 'AttributeType': 'S'},
+            {'AttributeName': 'username', 'AttributeType': 'S'}
+        ],
+        'GlobalSecondaryIndexes': [
+            {
+                'IndexName': 'username-index',
+                'KeySchema': [
+                    {'AttributeName': 'username', 'KeyType': 'HASH'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            }
+        ],
+    },
+    TRADES_TABLE: {
+        'KeySchema': [
+            {'AttributeName': 'trade_id', 'KeyType': 'HASH'}
+        ],
+        'AttributeDefinitions': [
+            {'AttributeName': 'trade_id', 'AttributeType': 'S'},
+            {'AttributeName': 'user_id', 'AttributeType': 'S'}
+        ],
+        'GlobalSecondaryIndexes': [
+            {
+                'IndexName': 'user-index',
+                'KeySchema': [
+                    {'AttributeName': 'user_id', 'KeyType': 'HASH'}
+                ],
+                'Projection': {'ProjectionType': 'ALL'}
+            }
+        ],
+    },
+    PORTFOLIO_TABLE: {
+        'KeySchema': [
+            {'AttributeName': 'user_id', 'KeyType': 'HASH'},
+            {'AttributeName': 'symbol', 'KeyType': 'RANGE'}
+        ],
+        'AttributeDefinitions': [
+            {'AttributeName': 'user_id', 'AttributeType': 'S'},
+            {'AttributeName': 'symbol', 'AttributeType': 'S'}
+        ],
+    },
+}
+
+_tables_checked = False
+_tables_lock = threading.Lock()
+
+def init_aws_tables():
+    """Create any missing DynamoDB tables, once per process"""
+    global _tables_checked
+    if _tables_checked or SKIP_TABLE_CHECK:
+        return
+    with _tables_lock:
+        if _tables_checked:
+            return
+        
+        try:
+            # One ListTables call instead of a failing CreateTable per existing table
+            client = get_dynamodb().meta.client
+            existing = set()
+            for page in client.get_paginator('list_tables').paginate():
+                existing.update(page['TableNames'])
+            
+            missing = [name for name in TABLE_SCHEMAS if name not in existing]
+            for name in missing:
+                client.create_table(TableName=name, BillingMode='PAY_PER_REQUEST', **TABLE_SCHEMAS[name])
+            for name in missing:
+                client.get_waiter('table_exists').wait(TableName=name)
+            if missing:
+                print(f"Created tables: {', '.join(missing)}")
+            
+            _tables_checked = True
+        except Exception as e:
+            print(f"Table check failed: {e}")
 
 def send_trade_notification(email, trade_details):
     """Send trade notification via SNS"""
@@ -141,7 +179,7 @@ def send_trade_notification(email, trade_details):
         Thank you for using Stocker!
         """
         
-        sns.publish(
+        get_sns().publish(
             TopicArn=SNS_TOPIC_ARN,
             Message=message,
             Subject=f"Trade Confirmation - {trade_details['action'].upper()} {trade_details['symbol']}"
@@ -149,11 +187,26 @@ def send_trade_notification(email, trade_details):
     except Exception as e:
         print(f"Failed to send notification: {e}")
 
+def send_statement_notification(email, day, statement_text):
+    """Email a daily statement from statements.py to its user via SES"""
+    # Not the SNS topic: every subscriber would get every user's statement
+    try:
+        get_ses().send_email(
+            Source=STATEMENT_SENDER,
+            Destination={'ToAddresses': [email]},
+            Message={
+                'Subject': {'Data': f"Daily Statement - {day}"},
+                'Body': {'Text': {'Data': statement_text}}
+            }
+        )
+    except Exception as e:
+        print(f"Failed to send statement to {email}: {e}")
+
 def get_user_portfolio(user_id):
     """Get user portfolio from DynamoDB"""
     try:
-        response = portfolio_table.query(
-            KeyConditionExpression=boto3.dynamodb.conditions.Key('user_id').eq(user_id)
+        response = get_table(PORTFOLIO_TABLE).query(
+            KeyConditionExpression=key('user_id').eq(user_id)
         )
         
         portfolio_value = 0
@@ -201,9 +254,9 @@ def signup():
         
         try:
             user_id = f"user_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{random.randint(1000, 9999)}"
-            password_hash = hash_password(password)
+            password_hash = passwords.hash_password(password)
             
-            users_table.put_item(
+            get_table(USERS_TABLE).put_item(
                 Item={
                     'user_id': user_id,
                     'username': username,
@@ -219,6 +272,9 @@ def signup():
             flash('Account created successfully! You can now log in.')
             return redirect(url_for('login'))
             
+        except passwords.Busy:
+            flash('Too many sign-ups right now, please try again in a moment!')
+            return render_template('signup.html'), 503, {'Retry-After': str(admission.RETRY_AFTER)}
         except Exception as e:
             flash('Username or email already exists!')
     
@@ -229,16 +285,26 @@ def login():
     if request.method == 'POST':
         username = request.form['username']
         password = request.form['password']
-        password_hash = hash_password(password)
         
         try:
-            response = users_table.query(
+            response = get_table(USERS_TABLE).query(
                 IndexName='username-index',
-                KeyConditionExpression=boto3.dynamodb.conditions.Key('username').eq(username)
+                KeyConditionExpression=key('username').eq(username)
             )
             
-            if response['Items'] and response['Items'][0]['password_hash'] == password_hash:
+            # Unknown usernames cost the same hash, so timing does not reveal which exist
+            stored = response['Items'][0]['password_hash'] if response['Items'] else passwords.DUMMY_HASH
+            matches, new_hash = passwords.verify(password, stored)
+            
+            if matches and response['Items']:
                 user = response['Items'][0]
+                if new_hash:
+                    # Upgrade legacy SHA-256 and old-cost hashes on a successful login
+                    get_table(USERS_TABLE).update_item(
+                        Key={'user_id': user['user_id']},
+                        UpdateExpression='SET password_hash = :hash',
+                        ExpressionAttributeValues={':hash': new_hash}
+                    )
                 
                 session['user_id'] = user['user_id']
                 session['username'] = user['username']
@@ -252,6 +318,9 @@ def login():
             else:
                 flash('Invalid username or password!')
                 
+        except passwords.Busy:
+            flash('Too many logins right now, please try again in a moment!')
+            return render_template('login.html'), 503, {'Retry-After': str(admission.RETRY_AFTER)}
         except Exception as e:
             flash('Login failed!')
     
@@ -269,14 +338,24 @@ def dashboard():
     
     try:
         # Get user balance
-        response = users_table.get_item(Key={'user_id': session['user_id']})
+        response = get_table(USERS_TABLE).get_item(Key={'user_id': session['user_id']})
         balance = float(response['Item']['balance'])
         
         # Get portfolio value
         _, portfolio_value = get_user_portfolio(session['user_id'])
         
+        virtual = len(STOCKS) > VIRTUAL_GRID_THRESHOLD
+        stock_grid = render_cache.fragment('stock_grid', price_version,
+                                           'stock_grid.html', stocks=STOCKS, virtual=virtual)
+        # Options only list names, so they change with the universe rather than prices;
+        # large universes are searched through /api/symbols/search instead
+        stock_options = '' if virtual else render_cache.fragment('stock_options', len(STOCKS),
+                                                                 'stock_options.html', stocks=STOCKS)
+        
         return render_template('dashboard.html', 
-                             stocks=STOCKS, 
+                             stock_grid=stock_grid,
+                             stock_options=stock_options,
+                             stock_count=len(STOCKS),
                              balance=balance, 
                              portfolio_value=portfolio_value)
     except Exception as e:
@@ -294,8 +373,10 @@ def trade(symbol):
     
     stock = STOCKS[symbol]
     stock['symbol'] = symbol
+    stock_card = render_cache.fragment(f'stock_card:{symbol}', price_version,
+                                       'stock_card.html', symbol=symbol, stock=stock)
     
-    return render_template('trade.html', stock=stock)
+    return render_template('trade.html', stock=stock, stock_card=stock_card)
 
 @app.route('/execute_trade', methods=['POST'])
 def execute_trade():
@@ -315,7 +396,7 @@ def execute_trade():
     
     try:
         # Get current user data
-        user_response = users_table.get_item(Key={'user_id': session['user_id']})
+        user_response = get_table(USERS_TABLE).get_item(Key={'user_id': session['user_id']})
         user = user_response['Item']
         balance = float(user['balance'])
         
@@ -326,7 +407,7 @@ def execute_trade():
             
             # Update balance
             new_balance = balance - total_cost
-            users_table.update_item(
+            get_table(USERS_TABLE).update_item(
                 Key={'user_id': session['user_id']},
                 UpdateExpression='SET balance = :balance',
                 ExpressionAttributeValues={':balance': Decimal(str(new_balance))}
@@ -334,7 +415,7 @@ def execute_trade():
             
             # Update portfolio
             try:
-                portfolio_response = portfolio_table.get_item(
+                portfolio_response = get_table(PORTFOLIO_TABLE).get_item(
                     Key={'user_id': session['user_id'], 'symbol': symbol}
                 )
                 
@@ -344,7 +425,7 @@ def execute_trade():
                     new_quantity = old_quantity + quantity
                     new_avg_price = ((old_quantity * old_avg_price) + (quantity * current_price)) / new_quantity
                     
-                    portfolio_table.update_item(
+                    get_table(PORTFOLIO_TABLE).update_item(
                         Key={'user_id': session['user_id'], 'symbol': symbol},
                         UpdateExpression='SET quantity = :qty, avg_price = :price',
                         ExpressionAttributeValues={
@@ -353,7 +434,7 @@ def execute_trade():
                         }
                     )
                 else:
-                    portfolio_table.put_item(
+                    get_table(PORTFOLIO_TABLE).put_item(
                         Item={
                             'user_id': session['user_id'],
                             'symbol': symbol,
@@ -367,7 +448,7 @@ def execute_trade():
         else:  # sell
             # Check portfolio
             try:
-                portfolio_response = portfolio_table.get_item(
+                portfolio_response = get_table(PORTFOLIO_TABLE).get_item(
                     Key={'user_id': session['user_id'], 'symbol': symbol}
                 )
                 
@@ -377,7 +458,7 @@ def execute_trade():
                 
                 # Update balance
                 new_balance = balance + total_cost
-                users_table.update_item(
+                get_table(USERS_TABLE).update_item(
                     Key={'user_id': session['user_id']},
                     UpdateExpression='SET balance = :balance',
                     ExpressionAttributeValues={':balance': Decimal(str(new_balance))}
@@ -388,11 +469,11 @@ def execute_trade():
                 new_quantity = old_quantity - quantity
                 
                 if new_quantity == 0:
-                    portfolio_table.delete_item(
+                    get_table(PORTFOLIO_TABLE).delete_item(
                         Key={'user_id': session['user_id'], 'symbol': symbol}
                     )
                 else:
-                    portfolio_table.update_item(
+                    get_table(PORTFOLIO_TABLE).update_item(
                         Key={'user_id': session['user_id'], 'symbol': symbol},
                         UpdateExpression='SET quantity = :qty',
                         ExpressionAttributeValues={':qty': new_quantity}
@@ -406,7 +487,7 @@ def execute_trade():
         trade_id = f"trade_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{random.randint(1000, 9999)}"
         timestamp = datetime.now().isoformat()
         
-        trades_table.put_item(
+        get_table(TRADES_TABLE).put_item(
             Item={
                 'trade_id': trade_id,
                 'user_id': session['user_id'],
@@ -447,7 +528,7 @@ def portfolio():
     
     # Get balance
     try:
-        response = users_table.get_item(Key={'user_id': session['user_id']})
+        response = get_table(USERS_TABLE).get_item(Key={'user_id': session['user_id']})
         balance = float(response['Item']['balance'])
     except:
         balance = 0
@@ -466,9 +547,9 @@ def history():
         return redirect(url_for('login'))
     
     try:
-        response = trades_table.query(
+        response = get_table(TRADES_TABLE).query(
             IndexName='user-index',
-            KeyConditionExpression=boto3.dynamodb.conditions.Key('user_id').eq(session['user_id'])
+            KeyConditionExpression=key('user_id').eq(session['user_id'])
         )
         
         trades = []
@@ -501,8 +582,8 @@ def admin_dashboard():
     try:
         # Get stats from DynamoDB
         # This is simplified - in production you'd use proper aggregation
-        users_response = users_table.scan()
-        trades_response = trades_table.scan()
+        users_response = get_table(USERS_TABLE).scan()
+        trades_response = get_table(TRADES_TABLE).scan()
         
         total_users = len([u for u in users_response['Items'] if u.get('role') == 'trader'])
         total_trades = len(trades_response['Items'])
@@ -522,7 +603,10 @@ def admin_dashboard():
 # Additional admin routes would follow similar patterns...
 
 @app.route('/api/stocks')
+@admission.polling(shared=True)
 def api_stocks():
+    global price_version
+    
     # Simulate price changes (same as local version)
     for symbol in STOCKS:
         change_percent = random.uniform(-0.02, 0.02)
@@ -530,9 +614,29 @@ def api_stocks():
         STOCKS[symbol]['change'] = STOCKS[symbol]['price'] * change_percent
         STOCKS[symbol]['price'] = round(STOCKS[symbol]['price'], 2)
         STOCKS[symbol]['change'] = round(STOCKS[symbol]['change'], 2)
+    price_version += 1
     
     return jsonify(STOCKS)
 
+@app.route('/api/symbols')
+def api_symbols():
+    # Cursor-paginated listing in ticker order: ?after=<last symbol>&limit=50
+    limit = max(1, min(request.args.get('limit', 50, type=int), 500))
+    page, next_cursor = symbols.get_index(STOCKS).page(request.args.get('after'), limit)
+    return jsonify({
+        'symbols': [dict(STOCKS[symbol], symbol=symbol) for symbol in page],
+        'next': next_cursor,
+        'total': len(STOCKS)
+    })
+
+@app.route('/api/symbols/search')
+def api_symbols_search():
+    # Ticker and company name prefix search for autocomplete: ?q=app&limit=20
+    limit = max(1, min(request.args.get('limit', 20, type=int), 100))
+    matches = symbols.get_index(STOCKS).search(request.args.get('q', ''), limit)
+    return jsonify([dict(STOCKS[symbol], symbol=symbol) for symbol in matches])
+
 if __name__ == '__main__':
     init_aws_tables()
+    prewarm()
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
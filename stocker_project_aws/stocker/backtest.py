@@ -0,0 +1,290 @@
+"""Headless backtesting against the platform's fill logic
+
+Replays a tick tape (one row of prices per tick, one column per symbol)
+through a strategy. Orders fill at the tick's price with the same arithmetic
+as /execute_trade (fills.fill) against an in-memory ledger, with no HTTP or
+database involved. Tapes are generated with the /api/stocks price model or
+loaded from a file.
+
+    python backtest.py --strategy momentum --ticks 1000000
+    python backtest.py --strategy buy_and_hold --runs 8 --workers 4
+    python backtest.py --tape ticks.csv --strategy momentum
+
+A strategy is any object with on_tick(tick, prices, broker); prices is the
+row of the tape for that tick, in tape.symbols order.
+"""
+import argparse
+import csv
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import fills
+import symbols
+
+# Largest per-tick move of the simulated price engine, as in /api/stocks
+VOLATILITY = 0.02
+
+
+class Tape:
+    """Prices for a fixed set of symbols, one row per tick"""
+
+    def __init__(self, symbols, prices):
+        self.symbols = list(symbols)
+        self.prices = np.asarray(prices, dtype=np.float64)
+        self.index = {symbol: i for i, symbol in enumerate(self.symbols)}
+
+    def __len__(self):
+        return len(self.prices)
+
+    def save(self, path):
+        np.savez_compressed(path, symbols=np.array(self.symbols), prices=self.prices)
+
+
+def generate_tape(start_prices, ticks, seed=None, volatility=VOLATILITY):
+    """Simulate ticks of the /api/stocks engine: a uniform +/-volatility move, rounded to cents"""
+    symbols = list(start_prices)
+    rng = np.random.default_rng(seed)
+    moves = 1 + rng.uniform(-volatility, volatility, size=(ticks, len(symbols)))
+    prices = np.empty((ticks, len(symbols)))
+    current = np.array([start_prices[symbol] for symbol in symbols], dtype=np.float64)
+    # Rounding each tick keeps prices identical to the live engine, so this stays sequential
+    for t in range(ticks):
+        current = np.round(current * moves[t], 2)
+        prices[t] = current
+    return Tape(symbols, prices)
+
+
+def load_tape(path):
+    """Load a tape saved with Tape.save, or a CSV of tick, symbol, price rows"""
+    if path.endswith('.npz'):
+        with np.load(path) as data:
+            return Tape(data['symbols'].tolist(), data['prices'])
+
+    with open(path, newline='') as f:
+        rows = [(int(tick), symbol, float(price)) for tick, symbol, price in csv.reader(f)
+                if tick.isdigit()]
+    symbols = sorted({symbol for _, symbol, _ in rows})
+    index = {symbol: i for i, symbol in enumerate(symbols)}
+    ticks = sorted({tick for tick, _, _ in rows})
+    positions = {tick: i for i, tick in enumerate(ticks)}
+    prices = np.full((len(ticks), len(symbols)), np.nan)
+    for tick, symbol, price in rows:
+        prices[positions[tick], index[symbol]] = price
+    # Symbols missing from a tick keep their last price
+    for j in range(len(symbols)):
+        column = prices[:, j]
+        filled = np.where(np.isnan(column), 0, np.arange(len(column)))
+        np.maximum.accumulate(filled, out=filled)
+        prices[:, j] = column[filled]
+    return Tape(symbols, prices)
+
+
+class Broker:
+    """In-memory ledger for one backtest run"""
+
+    def __init__(self, tape, balance=fills.STARTING_BALANCE):
+        self.tape = tape
+        self.balance = balance
+        self.holdings = {}
+        self.tick = 0
+        self.prices = None
+        # (tick, symbol index, signed quantity, signed cash) for each fill
+        self.fills = []
+        self.rejected = 0
+
+    def price(self, symbol):
+        return self.prices[self.tape.index[symbol]]
+
+    def position(self, symbol):
+        holding = self.holdings.get(symbol)
+        return holding[0] if holding else 0
+
+    def order(self, symbol, action, quantity):
+        """Fill an order at the current tick's price; returns False if rejected"""
+        price = float(self.price(symbol))
+        try:
+            self.balance, holding, total = fills.fill(self.balance, self.holdings.get(symbol),
+                                                      action, quantity, price)
+        except fills.OrderRejected:
+            self.rejected += 1
+            return False
+        if holding:
+            self.holdings[symbol] = holding
+        else:
+            self.holdings.pop(symbol, None)
+        sign = 1 if action == 'buy' else -1
+        self.fills.append((self.tick, self.tape.index[symbol], sign * quantity, -sign * total))
+        return True
+
+    def buy(self, symbol, quantity):
+        return self.order(symbol, 'buy', quantity)
+
+    def sell(self, symbol, quantity):
+        return self.order(symbol, 'sell', quantity)
+
+
+def equity_curve(tape, starting_balance, fill_log):
+    """Cash plus marked-to-market holdings at every tick, from the fill log"""
+    cash = np.zeros(len(tape))
+    equity = np.zeros(len(tape))
+    if fill_log:
+        ticks, columns, quantities, cash_flows = (np.array(column) for column in zip(*fill_log))
+        np.add.at(cash, ticks, cash_flows)
+        for j in np.unique(columns):
+            position = np.zeros(len(tape))
+            mask = columns == j
+            np.add.at(position, ticks[mask], quantities[mask])
+            equity += np.cumsum(position) * tape.prices[:, j]
+    return equity + starting_balance + np.cumsum(cash)
+
+
+def run(strategy, tape, balance=fills.STARTING_BALANCE):
+    """Replay a tape through a strategy and return the equity curve and fill statistics"""
+    broker = Broker(tape, balance)
+    on_tick = strategy.on_tick
+    prices = tape.prices
+    start = time.perf_counter()
+    for t in range(len(tape)):
+        broker.tick = t
+        broker.prices = prices[t]
+        on_tick(t, broker.prices, broker)
+    elapsed = time.perf_counter() - start
+
+    equity = equity_curve(tape, balance, broker.fills)
+    peaks = np.maximum.accumulate(equity)
+    returns = np.diff(equity) / equity[:-1] if len(equity) > 1 else np.zeros(0)
+    quantities = np.array([abs(f[2]) for f in broker.fills])
+    turnover = float(sum(abs(f[3]) for f in broker.fills))
+    return {
+        'strategy': type(strategy).__name__,
+        'ticks': len(tape),
+        'seconds': elapsed,
+        'ticks_per_second': len(tape) / elapsed if elapsed else 0.0,
+        'final_equity': float(equity[-1]) if len(equity) else balance,
+        'total_return': float(equity[-1] / balance - 1) if len(equity) else 0.0,
+        'max_drawdown': float(np.min(equity / peaks - 1)) if len(equity) else 0.0,
+        'volatility': float(np.std(returns)) if len(returns) else 0.0,
+        'fills': len(broker.fills),
+        'buys': sum(1 for f in broker.fills if f[2] > 0),
+        'sells': sum(1 for f in broker.fills if f[2] < 0),
+        'rejected': broker.rejected,
+        'shares_traded': int(quantities.sum()) if len(quantities) else 0,
+        'turnover': turnover,
+        'equity': equity,
+    }
+
+
+class BuyAndHold:
+    """Spend the starting balance evenly across symbols on the first tick"""
+
+    def __init__(self, symbols=None):
+        self.symbols = symbols
+
+    def on_tick(self, tick, prices, broker):
+        if tick:
+            return
+        symbols = self.symbols or broker.tape.symbols
+        budget = broker.balance / len(symbols)
+        for symbol in symbols:
+            quantity = int(budget // broker.price(symbol))
+            if quantity:
+                broker.buy(symbol, quantity)
+
+
+class Momentum:
+    """Hold a symbol while its price is above its moving average"""
+
+    def __init__(self, symbol='AAPL', window=50, quantity=10):
+        self.symbol = symbol
+        self.window = window
+        self.quantity = quantity
+        self.history = deque(maxlen=window)
+        self.total = 0.0
+
+    def on_tick(self, tick, prices, broker):
+        price = broker.price(self.symbol)
+        if len(self.history) == self.window:
+            self.total -= self.history[0]
+        self.history.append(price)
+        self.total += price
+        if len(self.history) < self.window:
+            return
+
+        holding = broker.position(self.symbol)
+        if price > self.total / self.window:
+            if not holding:
+                broker.buy(self.symbol, self.quantity)
+        elif holding:
+            broker.sell(self.symbol, holding)
+
+
+STRATEGIES = {
+    'buy_and_hold': BuyAndHold,
+    'momentum': Momentum,
+}
+
+
+def _run_job(job):
+    strategy_cls, strategy_kwargs, source = job
+    if isinstance(source, str):
+        tape = load_tape(source)
+    else:
+        tape = generate_tape(**source)
+    return run(strategy_cls(**strategy_kwargs), tape)
+
+
+def run_many(jobs, workers=None):
+    """Run independent backtests across a process pool
+
+    Each job is (strategy class, strategy kwargs, tape source), where the
+    source is a tape file path or generate_tape keyword arguments, so tapes
+    are built inside the workers instead of being pickled to them. Strategy
+    classes must be importable from a module.
+    """
+    if workers == 1:
+        return [_run_job(job) for job in jobs]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_run_job, jobs))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Backtest a strategy against simulated or recorded ticks')
+    parser.add_argument('--strategy', choices=sorted(STRATEGIES), default='momentum')
+    parser.add_argument('--tape', help='.npz tape or CSV of tick,symbol,price rows')
+    parser.add_argument('--ticks', type=int, default=100000, help='ticks to generate without --tape')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--runs', type=int, default=1, help='independent runs, seeds seed..seed+runs-1')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--save-tape', help='write the generated tape of the first run to this .npz file')
+    args = parser.parse_args(argv)
+
+    if args.tape:
+        sources = [args.tape] * args.runs
+    else:
+        start_prices = {symbol: stock['price'] for symbol, stock in symbols.load_stocks().items()}
+        sources = [{'start_prices': start_prices, 'ticks': args.ticks, 'seed': args.seed + i}
+                   for i in range(args.runs)]
+        if args.save_tape:
+            generate_tape(**sources[0]).save(args.save_tape)
+
+    start = time.perf_counter()
+    results = run_many([(STRATEGIES[args.strategy], {}, source) for source in sources],
+                       workers=min(args.workers, args.runs))
+    elapsed = time.perf_counter() - start
+
+    for i, result in enumerate(results):
+        print(f"run {i}: equity {result['final_equity']:.2f} ({result['total_return']:+.2%}), "
+              f"max drawdown {result['max_drawdown']:.2%}, {result['fills']} fills "
+              f"({result['rejected']} rejected), {result['ticks_per_second']:,.0f} ticks/s")
+    total_ticks = sum(result['ticks'] for result in results)
+    print(f"{total_ticks:,} ticks in {elapsed:.2f}s ({total_ticks / elapsed * 60:,.0f} ticks/min overall)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
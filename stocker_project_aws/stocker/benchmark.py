@@ -0,0 +1,687 @@
+"""Synthetic load generator and benchmark for the Stocker Flask app
+
+Seeds users into a scratch SQLite database, drives mixed traffic through
+the Flask test client or a real threaded WSGI server, and reports
+throughput and p50/p95/p99 latency per route plus database file growth.
+
+    python benchmark.py --users 50 --requests 5000 --threads 8
+    python benchmark.py --mode server --output results.json
+    python benchmark.py --compare results.json
+    python benchmark.py --scenario coldstart --import-budget-ms 500
+    python benchmark.py --scenario frontend --fresh --symbols 5000
+    python benchmark.py --scenario polling --fresh --threads 32 --requests 200
+    STOCKER_HASH_WORKERS=2 python benchmark.py --scenario login --fresh --threads 8
+    python benchmark.py --scenario rebalance --fresh --shards 4
+"""
+import argparse
+import http.cookiejar
+import json
+import logging
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import datetime
+
+import admission
+import app as stocker
+import passwords
+import sharding
+
+BENCH_PASSWORD = 'benchmark'
+
+# Relative weight of each action in the mixed workload
+TRADER_MIX = {
+    'dashboard': 10,
+    'api_stocks': 30,
+    'api_portfolio': 25,
+    'trade_page': 5,
+    'buy': 8,
+    'sell': 4,
+    'portfolio': 5,
+    'history': 3,
+    'login': 1,
+    'signup': 1,
+}
+ADMIN_MIX = {
+    'admin_dashboard': 1,
+    'admin_portfolio': 1,
+    'admin_history': 1,
+    'admin_manage': 1,
+}
+
+
+class TestClientSession:
+    """One virtual user talking to the app in-process"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def get(self, path):
+        return self.client.get(path).status_code
+
+    def post(self, path, data):
+        return self.client.post(path, data=data).status_code
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class HttpSession:
+    """One virtual user talking to a real server over HTTP"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect)
+
+    def _open(self, path, body=None):
+        try:
+            with self.opener.open(self.base_url + path, body) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+    def get(self, path):
+        return self._open(path)
+
+    def post(self, path, data):
+        return self._open(path, urllib.parse.urlencode(data).encode())
+
+
+def seed_users(count, admins=1):
+    """Insert benchmark users on their shards and return their (id, username, role)"""
+    # One salted hash shared by every seeded user keeps seeding fast
+    password_hash = passwords.hash_password(BENCH_PASSWORD)
+    users = []
+    for i in range(count + admins):
+        role = 'admin' if i < admins else 'trader'
+        username = f'bench_{role}_{i}'
+        email = f'{username}@example.com'
+        try:
+            user_id, shard = sharding.register_user(username, email)
+        except sqlite3.IntegrityError:
+            # Seeded by an earlier run
+            user_id, shard = None, sharding.find_user_shard(username)
+
+        conn = sharding.connect_shard(shard)
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT OR IGNORE INTO users (id, username, email, password_hash, role)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (user_id, username, email, password_hash, role))
+        cursor.execute('SELECT id FROM users WHERE username = ?', (username,))
+        users.append((cursor.fetchone()[0], username, role))
+        conn.commit()
+        conn.close()
+    return users
+
+
+def storage_paths():
+    paths = sharding.all_paths()
+    if sharding.SHARD_COUNT > 1:
+        paths.append(sharding.directory_path())
+    return paths
+
+
+def db_size(paths):
+    """Size of the database files including any WAL and shared-memory files"""
+    return sum(os.path.getsize(path + suffix) for path in paths
+               for suffix in ('', '-wal', '-shm') if os.path.exists(path + suffix))
+
+
+class VirtualUser:
+    def __init__(self, session, user_id, username, role, rng, record, mix=TRADER_MIX):
+        self.session = session
+        self.user_id = user_id
+        self.username = username
+        self.role = role
+        self.rng = rng
+        self.record = record
+        self.mix = mix
+        self.holdings = []
+
+    def timed(self, route, call, *args):
+        start = time.perf_counter()
+        status = call(*args)
+        self.record(route, time.perf_counter() - start, status)
+        return status
+
+    def login(self):
+        return self.timed('POST /login', self.session.post, '/login',
+                          {'username': self.username, 'password': BENCH_PASSWORD})
+
+    def step(self):
+        mix = ADMIN_MIX if self.role == 'admin' else self.mix
+        action = self.rng.choices(list(mix), weights=list(mix.values()))[0]
+        symbol = self.rng.choice(list(stocker.STOCKS))
+
+        if action == 'dashboard':
+            self.timed('GET /dashboard', self.session.get, '/dashboard')
+        elif action == 'api_stocks':
+            self.timed('GET /api/stocks', self.session.get, '/api/stocks')
+        elif action == 'api_portfolio':
+            self.timed('GET /api/portfolio/<id>', self.session.get, f'/api/portfolio/{self.user_id}')
+        elif action == 'trade_page':
+            self.timed('GET /trade/<symbol>', self.session.get, f'/trade/{symbol}')
+        elif action == 'buy':
+            self.timed('POST /execute_trade buy', self.session.post, '/execute_trade',
+                       {'symbol': symbol, 'action': 'buy', 'quantity': self.rng.randint(1, 5)})
+            self.holdings.append(symbol)
+        elif action == 'sell' and self.holdings:
+            symbol = self.holdings.pop(self.rng.randrange(len(self.holdings)))
+            self.timed('POST /execute_trade sell', self.session.post, '/execute_trade',
+                       {'symbol': symbol, 'action': 'sell', 'quantity': 1})
+        elif action == 'portfolio':
+            self.timed('GET /portfolio', self.session.get, '/portfolio')
+        elif action == 'history':
+            self.timed('GET /history', self.session.get, '/history')
+        elif action == 'login':
+            self.login()
+        elif action == 'signup':
+            name = f'bench_new_{threading.get_ident()}_{self.rng.randrange(10**9)}'
+            self.timed('POST /signup', self.session.post, '/signup',
+                       {'username': name, 'email': f'{name}@example.com', 'password': BENCH_PASSWORD})
+        elif action.startswith('admin_'):
+            page = action[len('admin_'):]
+            self.timed(f'GET /admin/{page}', self.session.get, f'/admin/{page}')
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def summarize(samples, errors, elapsed):
+    routes = {}
+    for route, latencies in sorted(samples.items()):
+        latencies.sort()
+        routes[route] = {
+            'count': len(latencies),
+            'errors': errors.get(route, 0),
+            'throughput': len(latencies) / elapsed if elapsed else 0.0,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000,
+        }
+    return routes
+
+
+def start_server(app):
+    """Serve the app on a free local port from a background thread"""
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def prepare_database(args, users, admins):
+    sharding.DATABASE = args.db
+    sharding.SHARD_COUNT = args.shards
+    if args.fresh:
+        for path in storage_paths():
+            if os.path.exists(path):
+                os.remove(path)
+    stocker.init_db()
+    return seed_users(users, admins=admins)
+
+
+def run_mixed(args, mix=TRADER_MIX, admins=None):
+    """Mixed trader/admin traffic against a freshly seeded database"""
+    users = prepare_database(args, args.users, args.admins if admins is None else admins)
+    size_before = db_size(storage_paths())
+
+    server = None
+    if args.mode == 'server':
+        server, base_url = start_server(stocker.app)
+        make_session = lambda: HttpSession(base_url)
+    else:
+        make_session = lambda: TestClientSession(stocker.app)
+
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+
+    def record(route, latency, status):
+        with lock:
+            samples[route].append(latency)
+            if status >= 400:
+                errors[route] += 1
+
+    virtual_users = [VirtualUser(make_session(), user_id, username, role,
+                                 random.Random(args.seed + i), record, mix)
+                     for i, (user_id, username, role) in enumerate(users)]
+    for user in virtual_users:
+        user.login()
+    samples.clear()
+    errors.clear()
+
+    remaining = [args.requests]
+
+    # Each thread owns a disjoint set of users so sessions are never shared
+    def worker(thread_index):
+        rng = random.Random(args.seed * 1000 + thread_index)
+        own = virtual_users[thread_index::args.threads]
+        if not own:
+            return
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            rng.choice(own).step()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    if server:
+        server.shutdown()
+
+    size_after = db_size(storage_paths())
+    total = sum(len(v) for v in samples.values())
+    return {
+        'elapsed_seconds': elapsed,
+        'requests': total,
+        'throughput': total / elapsed if elapsed else 0.0,
+        'db_bytes_before': size_before,
+        'db_bytes_after': size_after,
+        'db_growth_bytes': size_after - size_before,
+        'shards': args.shards,
+        'routes': summarize(samples, errors, elapsed),
+    }
+
+
+def run_trading(args):
+    """Buys and sells only, for measuring write throughput across shard counts"""
+    return run_mixed(args, mix={'buy': 2, 'sell': 1}, admins=0)
+
+
+def run_rebalance(args):
+    """Trades, then every user moved to the next shard, checking no rows are lost
+
+    Every target shard already holds other users' portfolio and trade rows,
+    so this fails if moves carry over shard-local row ids.
+    """
+    if args.shards < 2:
+        sys.exit('The rebalance scenario needs --shards 2 or more')
+    result = run_mixed(args, mix={'buy': 2, 'sell': 1}, admins=0)
+
+    def counts(user_id):
+        conn = sharding.connect_user(user_id)
+        try:
+            return tuple(conn.execute(f'SELECT COUNT(*) FROM {table} WHERE user_id = ?', (user_id,)).fetchone()[0]
+                         for table in ('portfolio', 'trades'))
+        finally:
+            conn.close()
+
+    conn = sharding.connect_directory()
+    assignments = conn.execute('SELECT user_id, shard FROM user_directory').fetchall()
+    conn.close()
+
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    start = time.perf_counter()
+    for user_id, shard in assignments:
+        before = counts(user_id)
+        move_start = time.perf_counter()
+        try:
+            sharding.move_user(user_id, (shard + 1) % args.shards)
+            moved = counts(user_id) == before
+        except sqlite3.Error as e:
+            print(f'Moving user {user_id} failed: {e}')
+            moved = False
+        samples['move_user'].append(time.perf_counter() - move_start)
+        if not moved:
+            errors['move_user'] += 1
+    elapsed = time.perf_counter() - start
+
+    result['routes'].update(summarize(samples, errors, elapsed))
+    result.update({'moves': len(assignments), 'failed_moves': errors['move_user']})
+    return result
+
+
+def run_login(args):
+    """Logins alongside trades: scrypt logins/s per hashing worker, and trade latency under them"""
+    passwords.start()
+    hashes_before = passwords.stats['hashes']
+    result = run_mixed(args, mix={'login': 4, 'buy': 1, 'sell': 1}, admins=0)
+    logins = result['routes'].get('POST /login', {}).get('throughput', 0.0)
+    result.update({
+        'hash_workers': passwords.WORKERS,
+        'logins_per_worker': logins / max(1, passwords.WORKERS),
+        'hashes': passwords.stats['hashes'] - hashes_before,
+    })
+    return result
+
+
+def run_polling(args):
+    """--threads sessions polling without pause while one trader places --requests trades
+
+    Runs against the threaded server so admission control sees real
+    concurrency; trade latency should hold while polls are coalesced,
+    rate limited or shed.
+    """
+    (trader, *pollers) = prepare_database(args, max(args.users, args.threads) + 1, 0)
+    server, base_url = start_server(stocker.app)
+    stats_before = dict(admission.stats)
+
+    samples = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def record(route, latency, status):
+        with lock:
+            samples[route].append(latency)
+            if status >= 400:
+                errors[route] += 1
+
+    def user(i, credentials, mix):
+        user_id, username, role = credentials
+        return VirtualUser(HttpSession(base_url), user_id, username, role,
+                           random.Random(args.seed + i), record, mix)
+
+    trading = user(0, trader, {'buy': 1, 'sell': 1})
+    polling = [user(i + 1, credentials, {'api_stocks': 3, 'api_portfolio': 1})
+               for i, credentials in enumerate(pollers[:args.threads])]
+    for virtual_user in [trading] + polling:
+        virtual_user.login()
+    samples.clear()
+    errors.clear()
+
+    def poll(virtual_user):
+        while not stop.is_set():
+            virtual_user.step()
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=poll, args=(virtual_user,)) for virtual_user in polling]
+    for thread in threads:
+        thread.start()
+    try:
+        for _ in range(args.requests):
+            trading.step()
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        server.shutdown()
+    elapsed = time.perf_counter() - start
+
+    total = sum(len(v) for v in samples.values())
+    return {
+        'elapsed_seconds': elapsed,
+        'requests': total,
+        'throughput': total / elapsed if elapsed else 0.0,
+        'admission': {name: admission.stats[name] - stats_before[name] for name in admission.stats},
+        'routes': summarize(samples, errors, elapsed),
+    }
+
+
+# Run in a fresh interpreter per sample; prints phase timings as JSON
+COLD_START_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import aws_app
+timings = {'import': time.perf_counter() - start}
+# No boto3 means no client or resource was built at import time
+eager = 'boto3' in sys.modules
+if aws_app.DYNAMODB_ENDPOINT:
+    start = time.perf_counter()
+    aws_app.init_aws_tables()
+    timings['init_tables'] = time.perf_counter() - start
+    start = time.perf_counter()
+    aws_app.prewarm()
+    timings['prewarm'] = time.perf_counter() - start
+client = aws_app.app.test_client()
+start = time.perf_counter()
+client.get('/login')
+timings['first_request'] = time.perf_counter() - start
+print(json.dumps({'timings': timings, 'boto3_at_import': eager}))
+'''
+
+
+def run_coldstart(args):
+    """Time importing and first use of aws_app in fresh interpreters
+
+    Set --dynamodb-endpoint to a local DynamoDB stand-in to include table
+    checks and connection pre-warming.
+    """
+    env = dict(os.environ)
+    env.setdefault('AWS_ACCESS_KEY_ID', 'benchmark')
+    env.setdefault('AWS_SECRET_ACCESS_KEY', 'benchmark')
+    if args.dynamodb_endpoint:
+        env['STOCKER_DYNAMODB_ENDPOINT'] = args.dynamodb_endpoint
+
+    samples = defaultdict(list)
+    eager_runs = 0
+    start = time.perf_counter()
+    for _ in range(args.runs):
+        output = subprocess.run([sys.executable, '-c', COLD_START_PROBE], capture_output=True, text=True,
+                                check=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__))).stdout
+        probe = json.loads(output.splitlines()[-1])
+        eager_runs += probe['boto3_at_import']
+        for phase, seconds in probe['timings'].items():
+            samples[phase].append(seconds)
+    elapsed = time.perf_counter() - start
+
+    routes = summarize(samples, {}, elapsed)
+    import_p95 = routes['import']['p95_ms']
+    return {
+        'elapsed_seconds': elapsed,
+        'requests': args.runs,
+        'throughput': args.runs / elapsed if elapsed else 0.0,
+        'import_budget_ms': args.import_budget_ms,
+        'boto3_at_import': eager_runs,
+        'budget_exceeded': import_p95 > args.import_budget_ms or eager_runs > 0,
+        'routes': routes,
+    }
+
+
+# Fetch one price update and wait until its frame has been rendered
+RENDER_STEP = '''async () => {
+    await window.stockerApp.updateStockPrices();
+    await new Promise(resolve => requestAnimationFrame(() => requestAnimationFrame(resolve)));
+}'''
+
+
+def run_frontend(args):
+    """Dashboard render frame times in headless Chromium, with --symbols stocks
+
+    Each step fetches /api/stocks, waits for the render frame and scrolls,
+    so the virtualized grid swaps cards in and out. Needs Playwright.
+    """
+    try:
+        from playwright.sync_api import sync_playwright
+    except ImportError:
+        sys.exit('The frontend scenario needs Playwright: pip install playwright && playwright install chromium')
+
+    for i in range(max(0, args.symbols - len(stocker.STOCKS))):
+        stocker.STOCKS[f'SYN{i:05d}'] = {'name': f'Synthetic {i}', 'price': 100.0, 'change': 0.0}
+    (_, username, _), = prepare_database(args, 1, 0)
+    server, base_url = start_server(stocker.app)
+
+    try:
+        with sync_playwright() as playwright:
+            browser = playwright.chromium.launch()
+            page = browser.new_page(viewport={'width': 1280, 'height': 900})
+            page.goto(f'{base_url}/login')
+            page.fill('input[name="username"]', username)
+            page.fill('input[name="password"]', BENCH_PASSWORD)
+            page.click('button[type="submit"]')
+            page.goto(f'{base_url}/dashboard')
+
+            start = time.perf_counter()
+            for _ in range(args.frames):
+                page.evaluate(RENDER_STEP)
+                page.mouse.wheel(0, 600)
+            elapsed = time.perf_counter() - start
+
+            frame_times = page.evaluate('window.stockerApp.frameTimes')
+            stats = page.evaluate('window.stockerApp.frameStats()')
+            browser.close()
+    finally:
+        server.shutdown()
+
+    return {
+        'elapsed_seconds': elapsed,
+        'requests': len(frame_times),
+        'throughput': len(frame_times) / elapsed if elapsed else 0.0,
+        'symbols': len(stocker.STOCKS),
+        'dom_cards': stats['cards'],
+        'routes': summarize({'render_frame': [ms / 1000 for ms in frame_times]}, {}, elapsed),
+    }
+
+
+SCENARIOS = {
+    'mixed': run_mixed,
+    'trading': run_trading,
+    'coldstart': run_coldstart,
+    'frontend': run_frontend,
+    'polling': run_polling,
+    'login': run_login,
+    'rebalance': run_rebalance,
+}
+
+
+def print_report(result):
+    print(f"\n{result['scenario']} @ {result.get('commit') or 'unknown commit'}: "
+          f"{result['requests']} requests in {result['elapsed_seconds']:.2f}s "
+          f"({result['throughput']:.1f} req/s)")
+    if 'db_growth_bytes' in result:
+        print(f"DB size ({result['shards']} shards) {result['db_bytes_before']} -> {result['db_bytes_after']} bytes "
+              f"(+{result['db_growth_bytes']})")
+    if 'dom_cards' in result:
+        print(f"{result['symbols']} symbols, {result['dom_cards']} stock cards in the DOM")
+    if 'hash_workers' in result:
+        print(f"{result['logins_per_worker']:.1f} logins/s per hashing worker "
+              f"({result['hash_workers']} workers, {result['hashes']} scrypt hashes)")
+    if 'moves' in result:
+        print(f"Moved {result['moves']} users to another shard, {result['failed_moves']} failed or lost rows")
+    if 'admission' in result:
+        print('Polls ' + ', '.join(f'{name} {count}' for name, count in result['admission'].items()))
+    if 'import_budget_ms' in result:
+        over = result['routes']['import']['p95_ms'] > result['import_budget_ms']
+        verdict = 'OVER BUDGET' if over else 'within budget'
+        print(f"Import p95 {result['routes']['import']['p95_ms']:.1f} ms, "
+              f"budget {result['import_budget_ms']:.0f} ms: {verdict}")
+        if result['boto3_at_import']:
+            print(f"Importing aws_app imported boto3 in {result['boto3_at_import']} of {result['requests']} runs")
+    print(f"{'route':<30}{'count':>8}{'err':>6}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for route, stats in result['routes'].items():
+        print(f"{route:<30}{stats['count']:>8}{stats['errors']:>6}{stats['throughput']:>10.1f}"
+              f"{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}")
+
+
+def compare(result, baseline, threshold):
+    """Print per-route p95 and throughput changes; return the regressed routes"""
+    regressions = []
+    print(f"\nComparison with {baseline.get('commit') or 'baseline'} (threshold {threshold:.0%})")
+    for route, stats in result['routes'].items():
+        old = baseline.get('routes', {}).get(route)
+        if not old or not old['p95_ms']:
+            continue
+        change = stats['p95_ms'] / old['p95_ms'] - 1
+        flag = ''
+        if change > threshold:
+            regressions.append(route)
+            flag = '  REGRESSION'
+        print(f"{route:<30} p95 {old['p95_ms']:>8.2f} -> {stats['p95_ms']:>8.2f} ms ({change:+.1%}){flag}")
+    if baseline.get('throughput'):
+        change = result['throughput'] / baseline['throughput'] - 1
+        print(f"{'overall throughput':<30} {baseline['throughput']:.1f} -> {result['throughput']:.1f} req/s ({change:+.1%})")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), default='mixed')
+    parser.add_argument('--mode', choices=('client', 'server'), default='client',
+                        help='Flask test client in-process, or a real threaded WSGI server')
+    parser.add_argument('--db', default='benchmark.db', help='scratch database file')
+    parser.add_argument('--shards', type=int, default=sharding.SHARD_COUNT,
+                        help='number of user shards (defaults to STOCKER_SHARDS)')
+    parser.add_argument('--fresh', action='store_true', help='delete the database before seeding')
+    parser.add_argument('--users', type=int, default=20)
+    parser.add_argument('--admins', type=int, default=1)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--runs', type=int, default=10, help='cold start samples')
+    parser.add_argument('--import-budget-ms', type=float, default=500,
+                        help='fail the coldstart scenario if importing aws_app exceeds this at p95')
+    parser.add_argument('--dynamodb-endpoint', help='local DynamoDB for the coldstart scenario')
+    parser.add_argument('--symbols', type=int, default=5000, help='stock universe size for the frontend scenario')
+    parser.add_argument('--frames', type=int, default=50, help='price updates rendered in the frontend scenario')
+    parser.add_argument('--poll-rate', type=float, default=None,
+                        help='per-session polling limit in requests/s (default: off, except in the polling scenario)')
+    parser.add_argument('--output', help='write JSON results to this file')
+    parser.add_argument('--compare', help='JSON results of an earlier run to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='relative p95 increase treated as a regression')
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args(argv)
+
+    # Virtual users poll with no think time, so only the polling scenario keeps the default limit
+    if args.poll_rate is not None:
+        admission.POLL_RATE = args.poll_rate
+    elif args.scenario != 'polling':
+        admission.POLL_RATE = 0
+
+    result = SCENARIOS[args.scenario](args)
+    result.update({
+        'scenario': args.scenario,
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'parameters': {k: v for k, v in vars(args).items()
+                       if k not in ('output', 'compare', 'fail_on_regression')},
+    })
+    print_report(result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f'\nResults written to {args.output}')
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        if regressions and args.fail_on_regression:
+            return 1
+    if result.get('budget_exceeded') or result.get('failed_moves'):
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,37 @@
+"""Order fill arithmetic shared by the web app and the backtester
+
+Holdings are (quantity, avg_price) tuples, or None for no position. Orders
+fill in full at the given price or are rejected.
+"""
+
+STARTING_BALANCE = 10000.0
+
+
+class OrderRejected(Exception):
+    pass
+
+
+def fill(balance, holding, action, quantity, price):
+    """Apply one order and return (new_balance, new_holding, total)
+
+    Raises OrderRejected with a user-facing message if the order cannot fill.
+    """
+    total = quantity * price
+
+    if action == 'buy':
+        if balance < total:
+            raise OrderRejected('Insufficient balance!')
+        if holding:
+            old_quantity, old_avg_price = holding
+            new_quantity = old_quantity + quantity
+            new_avg_price = ((old_quantity * old_avg_price) + (quantity * price)) / new_quantity
+            return balance - total, (new_quantity, new_avg_price), total
+        return balance - total, (quantity, price), total
+
+    if action == 'sell':
+        if not holding or holding[0] < quantity:
+            raise OrderRejected('Insufficient shares!')
+        new_quantity = holding[0] - quantity
+        return balance + total, ((new_quantity, holding[1]) if new_quantity else None), total
+
+    raise OrderRejected('Invalid action!')
@@ -0,0 +1,214 @@
+"""Background jobs for admin bulk operations
+
+Deleting or resetting a heavy trader touches every one of their trades. Doing
+that in one transaction inside the request holds the shard's write lock long
+enough to stall everyone else's trades, so these operations run on a single
+background worker that deletes CHUNK_SIZE rows per committed transaction and
+sleeps between chunks to let other writers in.
+
+The user's status is changed before a job is queued, so the user is locked
+out at once and the admin request returns immediately. The status also marks
+unfinished work: resume() re-queues it after a restart.
+"""
+import itertools
+import os
+import queue
+import threading
+import time
+
+import analytics
+import archive
+import fills
+import replica
+import sharding
+
+CHUNK_SIZE = int(os.environ.get('STOCKER_JOB_CHUNK_SIZE', 500))
+THROTTLE = float(os.environ.get('STOCKER_JOB_THROTTLE_MS', 20)) / 1000
+MAX_FINISHED = 100
+
+# users.status values; only active users can log in and trade
+ACTIVE = 'active'
+SUSPENDED = 'suspended'
+DELETING = 'deleting'
+RESETTING = 'resetting'
+
+_lock = threading.Lock()
+_queue = queue.Queue()
+# job id -> progress dict, oldest first
+_jobs = {}
+_ids = itertools.count(1)
+_worker = None
+
+stats = {'completed': 0, 'failed': 0}
+
+
+def set_status(user_id, status, allowed=(ACTIVE, SUSPENDED)):
+    """Change a user's status if it is currently one of allowed
+
+    Returns False if the user does not exist or is in another state, e.g.
+    already being deleted.
+    """
+    conn = sharding.connect_user(user_id)
+    try:
+        marks = ', '.join('?' * len(allowed))
+        cursor = conn.execute(f'UPDATE users SET status = ? WHERE id = ? AND status IN ({marks})',
+                              (status, user_id, *allowed))
+        conn.commit()
+        changed = cursor.rowcount > 0
+    finally:
+        conn.close()
+    if changed:
+        replica.mark_stale()
+    return changed
+
+
+def submit(kind, user_id):
+    """Queue a job and return a snapshot of its progress"""
+    global _worker
+    job = {
+        'id': next(_ids),
+        'kind': kind,
+        'user_id': user_id,
+        'state': 'queued',
+        'done': 0,
+        'total': None,
+        'error': None,
+        'created_at': time.time(),
+        'finished_at': None,
+    }
+    with _lock:
+        _jobs[job['id']] = job
+        _prune()
+        if _worker is None:
+            _worker = threading.Thread(target=_work, name='stocker-jobs', daemon=True)
+            _worker.start()
+    _queue.put(job['id'])
+    return dict(job)
+
+
+def _prune():
+    finished = [job_id for job_id, job in _jobs.items() if job['finished_at'] is not None]
+    for job_id in finished[:max(0, len(finished) - MAX_FINISHED)]:
+        del _jobs[job_id]
+
+
+def get(job_id):
+    with _lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job else None
+
+
+def all_jobs():
+    """Progress of queued, running and recently finished jobs, newest first"""
+    with _lock:
+        return [dict(job) for job in reversed(_jobs.values())]
+
+
+def by_user():
+    """Latest unfinished job per user id"""
+    with _lock:
+        return {job['user_id']: dict(job) for job in _jobs.values() if job['finished_at'] is None}
+
+
+def pending():
+    with _lock:
+        return sum(1 for job in _jobs.values() if job['finished_at'] is None)
+
+
+def _delete_chunked(conn, table, user_id, job):
+    while True:
+        cursor = conn.execute(f'''
+            DELETE FROM {table} WHERE id IN (
+                SELECT id FROM {table} WHERE user_id = ? LIMIT ?
+            )
+        ''', (user_id, CHUNK_SIZE))
+        conn.commit()
+        with _lock:
+            job['done'] += cursor.rowcount
+        if cursor.rowcount < CHUNK_SIZE:
+            return
+        time.sleep(THROTTLE)
+
+
+def _clear_holdings(conn, job):
+    user_id = job['user_id']
+    portfolio = conn.execute('SELECT COUNT(*) FROM portfolio WHERE user_id = ?', (user_id,)).fetchone()[0]
+    trades = conn.execute('SELECT COUNT(*) FROM trades WHERE user_id = ?', (user_id,)).fetchone()[0]
+    with _lock:
+        job['total'] = portfolio + trades
+    _delete_chunked(conn, 'portfolio', user_id, job)
+    _delete_chunked(conn, 'trades', user_id, job)
+    archive.purge_user(sharding.shard_for(user_id), user_id)
+
+
+def _run_delete(job):
+    user_id = job['user_id']
+    conn = sharding.connect_user(user_id)
+    try:
+        _clear_holdings(conn, job)
+        conn.execute('DELETE FROM users WHERE id = ?', (user_id,))
+        conn.commit()
+    finally:
+        conn.close()
+    sharding.unregister_user(user_id)
+
+
+def _run_reset(job):
+    user_id = job['user_id']
+    conn = sharding.connect_user(user_id)
+    try:
+        _clear_holdings(conn, job)
+        conn.execute('UPDATE users SET balance = ?, status = ? WHERE id = ?',
+                     (fills.STARTING_BALANCE, ACTIVE, user_id))
+        conn.commit()
+    finally:
+        conn.close()
+
+
+RUNNERS = {'delete': _run_delete, 'reset': _run_reset}
+
+
+def _work():
+    while True:
+        job_id = _queue.get()
+        with _lock:
+            job = _jobs[job_id]
+            job['state'] = 'running'
+        try:
+            RUNNERS[job['kind']](job)
+            state, error = 'done', None
+            stats['completed'] += 1
+        except Exception as e:
+            # The user keeps their in-progress status, so resume() retries it
+            print(f"Job {job_id} ({job['kind']} user {job['user_id']}) failed: {e}")
+            state, error = 'failed', str(e)
+            stats['failed'] += 1
+        analytics.invalidate(job['user_id'])
+        replica.mark_stale()
+        with _lock:
+            job.update(state=state, error=error, finished_at=time.time())
+
+
+def resume():
+    """Re-queue deletes and resets left unfinished by a previous process"""
+    def unfinished(conn):
+        return conn.execute('SELECT id, status FROM users WHERE status IN (?, ?)',
+                            (DELETING, RESETTING)).fetchall()
+
+    kinds = {DELETING: 'delete', RESETTING: 'reset'}
+    resumed = 0
+    for rows in sharding.scatter(unfinished):
+        for user_id, status in rows:
+            submit(kinds[status], user_id)
+            resumed += 1
+    return resumed
+
+
+def wait(timeout=None):
+    """Block until every queued job has finished; for scripts and benchmarks"""
+    deadline = None if timeout is None else time.time() + timeout
+    while pending():
+        if deadline is not None and time.time() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
@@ -0,0 +1,315 @@
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+
+from flask import g, has_request_context, request
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+# Slow-request profiling is off unless a threshold is configured
+PROFILE_SLOW_MS = float(os.environ.get('STOCKER_PROFILE_SLOW_MS', 0))
+PROFILE_INTERVAL = float(os.environ.get('STOCKER_PROFILE_INTERVAL_MS', 5)) / 1000
+PROFILE_DIR = os.environ.get('STOCKER_PROFILE_DIR', 'profiles')
+
+# Total time a statement may wait on a locked database, as sqlite3.connect's timeout.
+# sqlite itself only waits BUSY_STEP; the cursor retries, so lock waits before
+# a statement succeeds are measured too.
+BUSY_TIMEOUT = float(os.environ.get('STOCKER_DB_BUSY_TIMEOUT', 5.0))
+BUSY_STEP = 0.01
+READ_STATEMENTS = ('SELECT', 'WITH', 'PRAGMA', 'EXPLAIN')
+
+_lock = threading.Lock()
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        with _lock:
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+            self.count += 1
+            self.sum += value
+
+
+request_latency = defaultdict(Histogram)
+request_queries = defaultdict(lambda: Histogram(QUERY_COUNT_BUCKETS))
+request_db_time = defaultdict(Histogram)
+request_total = Counter()
+errors_total = Counter()
+price_tick = Histogram()
+# 'read' or 'write' -> time per statement, including any lock wait
+statement_time = defaultdict(Histogram)
+db = {'queries': 0, 'seconds': 0.0, 'busy': 0, 'lock_waits': 0, 'lock_wait_seconds': 0.0}
+
+# name -> (help text, callable returning the current value, metric type)
+_gauges = {}
+
+
+def register_gauge(name, help_text, read, kind='gauge'):
+    """Expose a value computed at scrape time, e.g. a cache hit rate"""
+    _gauges[name] = (help_text, read, kind)
+
+
+def hit_rate(stats):
+    """Fraction of lookups served from cache for a hits/misses dict"""
+    lookups = stats['hits'] + stats['misses']
+    return stats['hits'] / lookups if lookups else 0.0
+
+
+def _record_query(kind, elapsed, waited=0.0, busy=False):
+    statement_time[kind].observe(elapsed)
+    with _lock:
+        db['queries'] += 1
+        db['seconds'] += elapsed
+        if waited:
+            db['lock_waits'] += 1
+            db['lock_wait_seconds'] += waited
+        if busy:
+            db['busy'] += 1
+    if has_request_context() and 'db_queries' in g:
+        g.db_queries += 1
+        g.db_time += elapsed
+
+
+def _is_busy(error):
+    message = str(error)
+    return 'locked' in message or 'busy' in message
+
+
+def _statement_kind(sql):
+    return 'read' if sql.lstrip()[:7].upper().startswith(READ_STATEMENTS) else 'write'
+
+
+def _timed(kind, budget, run, *args):
+    """Run a statement, retrying SQLITE_BUSY until budget seconds have passed"""
+    start = time.perf_counter()
+    waited = 0.0
+    while True:
+        attempt = time.perf_counter()
+        try:
+            result = run(*args)
+            break
+        except sqlite3.OperationalError as e:
+            if not _is_busy(e):
+                _record_query(kind, time.perf_counter() - start, waited)
+                raise
+            waited += time.perf_counter() - attempt
+            if time.perf_counter() - start >= budget:
+                _record_query(kind, time.perf_counter() - start, waited, busy=True)
+                raise
+        except sqlite3.Error:
+            _record_query(kind, time.perf_counter() - start, waited)
+            raise
+    _record_query(kind, time.perf_counter() - start, waited)
+    return result
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times every statement and measures waits on locked databases"""
+
+    def execute(self, sql, parameters=()):
+        return _timed(_statement_kind(sql), self.connection.busy_timeout, super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        # Rows before a failure may have run, so sqlite waits the whole budget instead of retrying
+        connection = self.connection
+        super().execute(f'PRAGMA busy_timeout = {int(connection.busy_timeout * 1000)}')
+        try:
+            return _timed(_statement_kind(sql), 0, super().executemany, sql, seq_of_parameters)
+        finally:
+            super().execute(f'PRAGMA busy_timeout = {int(BUSY_STEP * 1000)}')
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors report to the metrics registry"""
+
+    busy_timeout = BUSY_TIMEOUT
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # The C shortcuts bypass cursor(), so route them through it
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        # Committing waits for readers to leave in rollback-journal mode
+        return _timed('write', self.busy_timeout, super().commit)
+
+
+def connect(database, timeout=None, **kwargs):
+    """sqlite3.connect with query timing and lock wait measurement"""
+    conn = sqlite3.connect(database, factory=InstrumentedConnection, timeout=BUSY_STEP, **kwargs)
+    conn.busy_timeout = BUSY_TIMEOUT if timeout is None else timeout
+    return conn
+
+
+def count_error():
+    """Record a handled failure against the current endpoint"""
+    endpoint = request.endpoint if has_request_context() else None
+    with _lock:
+        errors_total[endpoint or 'none'] += 1
+
+
+# Sampling profiler: thread id -> Counter of collapsed stacks
+_profiles = {}
+_sampler = None
+
+
+def _collapse(frame):
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+        frame = frame.f_back
+    return ';'.join(reversed(stack))
+
+
+def _sample_loop():
+    while True:
+        time.sleep(PROFILE_INTERVAL)
+        frames = sys._current_frames()
+        with _lock:
+            for thread_id, samples in _profiles.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    samples[_collapse(frame)] += 1
+
+
+def _start_profiling():
+    global _sampler
+    with _lock:
+        if _sampler is None:
+            _sampler = threading.Thread(target=_sample_loop, name='stocker-profiler', daemon=True)
+            _sampler.start()
+        _profiles[threading.get_ident()] = Counter()
+
+
+def _finish_profiling(endpoint, elapsed):
+    with _lock:
+        samples = _profiles.pop(threading.get_ident(), None)
+    if not samples or elapsed * 1000 < PROFILE_SLOW_MS:
+        return
+
+    # Collapsed-stack format, readable by flamegraph.pl and speedscope
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint}-{int(elapsed * 1000)}ms.folded"
+    with open(os.path.join(PROFILE_DIR, name), 'w') as f:
+        for stack, count in samples.most_common():
+            f.write(f'{stack} {count}\n')
+
+
+def init_app(app):
+    """Install per-request timing hooks on a Flask app"""
+
+    @app.before_request
+    def start_timer():
+        g.request_start = time.perf_counter()
+        g.db_queries = 0
+        g.db_time = 0.0
+        if PROFILE_SLOW_MS:
+            _start_profiling()
+
+    @app.after_request
+    def record_request(response):
+        if 'request_start' not in g:
+            return response
+        elapsed = time.perf_counter() - g.request_start
+        endpoint = request.endpoint or 'none'
+        request_latency[endpoint].observe(elapsed)
+        request_queries[endpoint].observe(g.db_queries)
+        request_db_time[endpoint].observe(g.db_time)
+        with _lock:
+            request_total[(endpoint, request.method, response.status_code)] += 1
+        if PROFILE_SLOW_MS:
+            _finish_profiling(endpoint, elapsed)
+        return response
+
+    @app.teardown_request
+    def record_exception(exc):
+        if exc is not None:
+            count_error()
+
+
+def _labels(**labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in labels.items()) + '}'
+
+
+def _histogram_lines(name, histogram, **labels):
+    lines = []
+    for bound, count in zip(histogram.buckets, histogram.counts):
+        lines.append(f'{name}_bucket{_labels(**labels, le=bound)} {count}')
+    lines.append(f'{name}_bucket{_labels(**labels, le="+Inf")} {histogram.count}')
+    lines.append(f'{name}_sum{_labels(**labels)} {histogram.sum}')
+    lines.append(f'{name}_count{_labels(**labels)} {histogram.count}')
+    return lines
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+
+    def header(name, kind, help_text):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+
+    header('stocker_request_duration_seconds', 'histogram', 'Request latency by endpoint')
+    for endpoint, histogram in sorted(request_latency.items()):
+        lines.extend(_histogram_lines('stocker_request_duration_seconds', histogram, endpoint=endpoint))
+
+    header('stocker_request_db_queries', 'histogram', 'SQL statements executed per request')
+    for endpoint, histogram in sorted(request_queries.items()):
+        lines.extend(_histogram_lines('stocker_request_db_queries', histogram, endpoint=endpoint))
+
+    header('stocker_request_db_seconds', 'histogram', 'Time spent in SQL per request')
+    for endpoint, histogram in sorted(request_db_time.items()):
+        lines.extend(_histogram_lines('stocker_request_db_seconds', histogram, endpoint=endpoint))
+
+    header('stocker_requests_total', 'counter', 'Requests by endpoint, method and status')
+    for (endpoint, method, status), count in sorted(request_total.items()):
+        lines.append(f'stocker_requests_total{_labels(endpoint=endpoint, method=method, status=status)} {count}')
+
+    header('stocker_errors_total', 'counter', 'Failed requests and handled errors by endpoint')
+    for endpoint, count in sorted(errors_total.items()):
+        lines.append(f'stocker_errors_total{_labels(endpoint=endpoint)} {count}')
+
+    header('stocker_db_queries_total', 'counter', 'SQL statements executed')
+    lines.append(f"stocker_db_queries_total {db['queries']}")
+    header('stocker_db_seconds_total', 'counter', 'Time spent executing SQL')
+    lines.append(f"stocker_db_seconds_total {db['seconds']}")
+    header('stocker_db_busy_total', 'counter', 'Statements that failed with SQLITE_BUSY or a locked database')
+    lines.append(f"stocker_db_busy_total {db['busy']}")
+    header('stocker_db_lock_waits_total', 'counter', 'Statements that waited on a locked database, including ones that then succeeded')
+    lines.append(f"stocker_db_lock_waits_total {db['lock_waits']}")
+    header('stocker_db_lock_wait_seconds_total', 'counter', 'Time statements spent waiting on database locks')
+    lines.append(f"stocker_db_lock_wait_seconds_total {db['lock_wait_seconds']}")
+
+    header('stocker_db_statement_seconds', 'histogram', 'Time per SQL statement, including lock waits, by read or write')
+    for kind, histogram in sorted(statement_time.items()):
+        lines.extend(_histogram_lines('stocker_db_statement_seconds', histogram, kind=kind))
+
+    header('stocker_price_tick_seconds', 'histogram', 'Time to simulate one price tick')
+    lines.extend(_histogram_lines('stocker_price_tick_seconds', price_tick))
+
+    for name, (help_text, read, kind) in sorted(_gauges.items()):
+        header(name, kind, help_text)
+        lines.append(f'{name} {read()}')
+
+    return '\n'.join(lines) + '\n'
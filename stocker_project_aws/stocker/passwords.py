@@ -0,0 +1,130 @@
+"""Password hashing with scrypt on a bounded process pool
+
+Hashes are stored as scrypt$n$r$p$salt$hash (hex salt and hash). scrypt is
+deliberately slow and memory hungry, so it runs in STOCKER_HASH_WORKERS
+worker processes rather than in request threads; a request waiting on a hash
+holds no GIL, and at most STOCKER_HASH_QUEUE hashes are queued or running
+at once so a login storm cannot take every core from trading. Requests that
+cannot get a queue slot within STOCKER_HASH_WAIT_MS raise Busy.
+
+Accounts created before scrypt have an unsalted SHA-256 hex digest; verify()
+accepts those and returns a fresh scrypt hash so login can migrate them, and
+does the same for scrypt hashes made with an older cost.
+"""
+import hashlib
+import hmac
+import os
+import threading
+
+# Cost parameters; raising N rehashes each account at its next login
+SCRYPT_N = int(os.environ.get('STOCKER_SCRYPT_N', 2 ** 14))
+SCRYPT_R = int(os.environ.get('STOCKER_SCRYPT_R', 8))
+SCRYPT_P = int(os.environ.get('STOCKER_SCRYPT_P', 1))
+SALT_BYTES = 16
+KEY_BYTES = 32
+# Checked when a username does not exist, so unknown names cost the same hash as real ones
+DUMMY_HASH = f'scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${"00" * SALT_BYTES}${"00" * KEY_BYTES}'
+
+# 0 workers hashes inline in the calling thread
+WORKERS = int(os.environ.get('STOCKER_HASH_WORKERS', max(1, (os.cpu_count() or 2) // 2)))
+QUEUE = int(os.environ.get('STOCKER_HASH_QUEUE', max(1, WORKERS) * 4))
+WAIT = int(os.environ.get('STOCKER_HASH_WAIT_MS', 2000)) / 1000
+
+_lock = threading.Lock()
+_executor = None
+_slots = threading.BoundedSemaphore(QUEUE)
+
+stats = {'hashes': 0, 'rehashed': 0, 'busy': 0}
+
+
+class Busy(Exception):
+    """Too many hashes already queued"""
+
+
+def _scrypt(password, salt, n, r, p):
+    # Headroom over the 128 * n * r bytes scrypt needs
+    maxmem = 128 * n * r * (p + 2) + 1024 * 1024
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=maxmem, dklen=KEY_BYTES)
+
+
+def _pool():
+    global _executor
+    with _lock:
+        if _executor is None:
+            # Imported here so aws_app cold starts do not pay for multiprocessing
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # Forking a threaded server can copy held locks into the workers
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _executor = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context(method))
+        return _executor
+
+
+def _discard(pool):
+    global _executor
+    with _lock:
+        if _executor is pool:
+            _executor = None
+    pool.shutdown(wait=False)
+
+
+def start():
+    """Start the worker processes now instead of on the first login"""
+    if WORKERS:
+        _pool().submit(int).result()
+
+
+def _derive(password, salt, n, r, p):
+    if not _slots.acquire(timeout=WAIT):
+        stats['busy'] += 1
+        raise Busy()
+    try:
+        stats['hashes'] += 1
+        if not WORKERS:
+            return _scrypt(password, salt, n, r, p)
+        pool = _pool()
+        from concurrent.futures.process import BrokenProcessPool
+        try:
+            return pool.submit(_scrypt, password, salt, n, r, p).result()
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); replace the pool and retry once
+            _discard(pool)
+            return _pool().submit(_scrypt, password, salt, n, r, p).result()
+    finally:
+        _slots.release()
+
+
+def hash_password(password):
+    salt = os.urandom(SALT_BYTES)
+    key = _derive(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f'scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt.hex()}${key.hex()}'
+
+
+def verify(password, stored):
+    """Check a password against a stored hash
+
+    Returns (matches, new_hash); new_hash is set when the stored hash is
+    legacy SHA-256 or uses other scrypt parameters and should be replaced.
+    A malformed stored hash never matches.
+    """
+    if not stored.startswith('scrypt$'):
+        legacy = hashlib.sha256(password.encode()).hexdigest()
+        if not hmac.compare_digest(legacy, stored):
+            return False, None
+        stats['rehashed'] += 1
+        return True, hash_password(password)
+
+    try:
+        _, n, r, p, salt, key = stored.split('$')
+        n, r, p, salt, key = int(n), int(r), int(p), bytes.fromhex(salt), bytes.fromhex(key)
+        # scrypt itself rejects bad costs, e.g. n not a power of two
+        derived = _derive(password, salt, n, r, p)
+    except ValueError as e:
+        print(f"Malformed scrypt password hash: {e}")
+        return False, None
+    if not hmac.compare_digest(derived, key):
+        return False, None
+    if (n, r, p) != (SCRYPT_N, SCRYPT_R, SCRYPT_P):
+        stats['rehashed'] += 1
+        return True, hash_password(password)
+    return True, None
@@ -0,0 +1,54 @@
+import threading
+
+from flask import render_template, session
+from markupsafe import Markup
+
+# Rendered HTML keyed by fragment name, holding only the latest version
+_fragments = {}
+_pages = {}
+_lock = threading.Lock()
+
+stats = {'hits': 0, 'misses': 0}
+
+
+def fragment(name, version, template, **context):
+    """Render a shared fragment once per version and reuse it across users"""
+    with _lock:
+        entry = _fragments.get(name)
+        if entry and entry[0] == version:
+            stats['hits'] += 1
+            return entry[1]
+        stats['misses'] += 1
+
+    html = Markup(render_template(template, **context))
+    with _lock:
+        current = _fragments.get(name)
+        # Never replace a newer version rendered by a concurrent request
+        if not current or current[0] <= version:
+            _fragments[name] = (version, html)
+    return html
+
+
+def page(template):
+    """Render a static page once; pages with pending flash messages skip the cache"""
+    if session.get('_flashes'):
+        return render_template(template)
+
+    with _lock:
+        html = _pages.get(template)
+        if html is not None:
+            stats['hits'] += 1
+            return html
+        stats['misses'] += 1
+
+    html = render_template(template)
+    with _lock:
+        _pages[template] = html
+    return html
+
+
+def clear():
+    """Drop every cached fragment and page"""
+    with _lock:
+        _fragments.clear()
+        _pages.clear()
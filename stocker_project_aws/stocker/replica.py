@@ -0,0 +1,157 @@
+import os
+import sqlite3
+import threading
+import time
+
+import metrics
+
+# Replica mode is opt-in; admin reads may then be up to MAX_AGE seconds stale
+ENABLED = os.environ.get('STOCKER_READ_REPLICA', '').lower() in ('1', 'true', 'yes')
+MAX_AGE = float(os.environ.get('STOCKER_REPLICA_MAX_AGE', 30))
+REFRESH_INTERVAL = float(os.environ.get('STOCKER_REPLICA_REFRESH', MAX_AGE / 2))
+# Rollback-journal databases are copied this many pages at a time, pausing between steps
+STEP_PAGES = int(os.environ.get('STOCKER_REPLICA_STEP_PAGES', 256))
+STEP_SLEEP = float(os.environ.get('STOCKER_REPLICA_STEP_SLEEP_MS', 5)) / 1000
+# A write between steps restarts the copy; after this many restarts it is finished in one step
+STEP_RESTARTS = 3
+
+_lock = threading.Lock()
+# source path -> lock held while that database is copied
+_path_locks = {}
+# source path -> time its current snapshot was taken
+_refreshed_at = {}
+_refresher = None
+# Set to make the background refresher take new snapshots now
+_wake = threading.Event()
+
+stats = {'refreshes': 0, 'last_refresh_seconds': 0.0}
+
+
+def replica_path(source_path):
+    base, ext = os.path.splitext(source_path)
+    return f'{base}_replica{ext}'
+
+
+def _path_lock(source_path):
+    with _lock:
+        return _path_locks.setdefault(source_path, threading.Lock())
+
+
+def use_wal(source_path):
+    """Switch a database to WAL so snapshot reads never block its writers
+
+    The mode is stored in the file; returns False if it could not be changed
+    now, e.g. because another connection holds a lock.
+    """
+    conn = sqlite3.connect(source_path)
+    try:
+        return conn.execute('PRAGMA journal_mode=WAL').fetchone()[0] == 'wal'
+    except sqlite3.OperationalError:
+        return False
+    finally:
+        conn.close()
+
+
+class _Restarting(Exception):
+    pass
+
+
+def _stepped_backup(source, target):
+    progress = {'remaining': None, 'restarts': 0}
+
+    def pause(status, remaining, total):
+        if progress['remaining'] is not None and remaining > progress['remaining']:
+            progress['restarts'] += 1
+            if progress['restarts'] > STEP_RESTARTS:
+                raise _Restarting()
+        progress['remaining'] = remaining
+        # Between steps the source is unlocked, so queued writers can commit
+        time.sleep(STEP_SLEEP)
+
+    try:
+        source.backup(target, pages=STEP_PAGES, progress=pause)
+    except _Restarting:
+        source.backup(target)
+
+
+def refresh(source_path, max_age=None):
+    """Copy a database into a fresh snapshot with the online backup API
+
+    With max_age, skip the copy if a concurrent caller already refreshed.
+    """
+    with _path_lock(source_path):
+        refreshed_at = _refreshed_at.get(source_path)
+        if max_age is not None and refreshed_at is not None and time.time() - refreshed_at <= max_age:
+            return
+        start = time.time()
+        path = replica_path(source_path)
+        tmp_path = path + '.tmp'
+        source = sqlite3.connect(source_path)
+        target = sqlite3.connect(tmp_path)
+        try:
+            if source.execute('PRAGMA journal_mode').fetchone()[0] == 'wal' or use_wal(source_path):
+                # A WAL reader sees one consistent snapshot and does not block commits
+                source.backup(target)
+                # The copy's header says WAL; readers of a read-only snapshot must not need -wal/-shm files
+                target.execute('PRAGMA journal_mode=DELETE')
+            else:
+                # A one-shot copy would hold the shared lock for the whole file
+                _stepped_backup(source, target)
+        finally:
+            target.close()
+            source.close()
+        # Readers holding the old file keep their handle; new readers get the new copy
+        os.replace(tmp_path, path)
+        _refreshed_at[source_path] = start
+        stats['refreshes'] += 1
+        stats['last_refresh_seconds'] = time.time() - start
+
+
+def age():
+    """Seconds since the oldest current snapshot was taken, or None if there is none"""
+    if not _refreshed_at:
+        return None
+    return time.time() - min(_refreshed_at.values())
+
+
+def mark_stale():
+    """Take new snapshots soon, e.g. after an admin action"""
+    if _refresher is not None:
+        _wake.set()
+    else:
+        _refreshed_at.clear()
+
+
+def connect(source_path):
+    """Read-only connection to a snapshot of source_path
+
+    While the background refresher runs, requests never copy the database
+    themselves and get the latest snapshot it took; otherwise a snapshot
+    older than MAX_AGE is refreshed first.
+    """
+    refreshed_at = _refreshed_at.get(source_path)
+    if refreshed_at is None or (_refresher is None and time.time() - refreshed_at > MAX_AGE):
+        refresh(source_path, max_age=MAX_AGE)
+    return metrics.connect(f'file:{replica_path(source_path)}?mode=ro', uri=True)
+
+
+def _refresh_loop(source_paths):
+    while True:
+        _wake.wait(REFRESH_INTERVAL)
+        _wake.clear()
+        for source_path in source_paths:
+            try:
+                refresh(source_path)
+            except sqlite3.Error as e:
+                print(f"Replica refresh of {source_path} failed: {e}")
+
+
+def start(source_paths):
+    """Take initial snapshots and keep refreshing them in the background"""
+    global _refresher
+    for source_path in source_paths:
+        refresh(source_path)
+    if _refresher is None:
+        _refresher = threading.Thread(target=_refresh_loop, args=(list(source_paths),),
+                                      name='stocker-replica', daemon=True)
+        _refresher.start()
@@ -0,0 +1,302 @@
+"""User-sharded SQLite storage
+
+Each user lives in exactly one shard file holding that user's row, portfolio
+and trades, so trades by users on different shards never contend for the same
+SQLite write lock. A small directory database hands out globally unique user
+ids and records which shard each user is on; it is only written on signup,
+deletion and rebalancing, never on the trading path.
+
+With STOCKER_SHARDS=1 (the default) the single stocker.db is used unchanged
+and the directory is not involved.
+
+    python sharding.py status
+    python sharding.py split          # distribute an existing stocker.db
+    python sharding.py move <user_id> <shard>
+    python sharding.py rebalance      # move users to their hashed home shard
+
+Running app processes cache shard assignments, so move and rebalance users
+while the app is stopped.
+"""
+import os
+import sqlite3
+import sys
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+DATABASE = 'stocker.db'
+SHARD_COUNT = int(os.environ.get('STOCKER_SHARDS', 1))
+
+_lock = threading.Lock()
+_shard_cache = {}
+_executor = None
+
+
+def shard_path(shard):
+    if SHARD_COUNT == 1:
+        return DATABASE
+    base, ext = os.path.splitext(DATABASE)
+    return f'{base}_shard{shard}{ext}'
+
+
+def directory_path():
+    base, ext = os.path.splitext(DATABASE)
+    return f'{base}_directory{ext}'
+
+
+def all_paths():
+    return [shard_path(shard) for shard in range(SHARD_COUNT)]
+
+
+def connect_shard(shard):
+    return metrics.connect(shard_path(shard))
+
+
+def connect_directory():
+    return metrics.connect(directory_path())
+
+
+def home_shard(user_id):
+    """Shard a user is placed on by default"""
+    return zlib.crc32(str(user_id).encode()) % SHARD_COUNT
+
+
+def init_directory():
+    if SHARD_COUNT == 1:
+        return
+    conn = connect_directory()
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_directory (
+            user_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            shard INTEGER NOT NULL
+        )
+    ''')
+    conn.commit()
+    conn.close()
+
+
+def shard_for(user_id):
+    """Shard holding a user, from the directory and cached in memory"""
+    if SHARD_COUNT == 1:
+        return 0
+    with _lock:
+        shard = _shard_cache.get(user_id)
+    if shard is not None:
+        return shard
+
+    conn = connect_directory()
+    row = conn.execute('SELECT shard FROM user_directory WHERE user_id = ?', (user_id,)).fetchone()
+    conn.close()
+    shard = row[0] if row else home_shard(user_id)
+    with _lock:
+        _shard_cache[user_id] = shard
+    return shard
+
+
+def connect_user(user_id):
+    return connect_shard(shard_for(user_id))
+
+
+def find_user_shard(username):
+    """Shard holding a username, or None if the username is unknown"""
+    if SHARD_COUNT == 1:
+        return 0
+    conn = connect_directory()
+    row = conn.execute('SELECT shard FROM user_directory WHERE username = ?', (username,)).fetchone()
+    conn.close()
+    return row[0] if row else None
+
+
+def register_user(username, email):
+    """Reserve a globally unique user id and its shard
+
+    Returns (None, 0) in single-file mode, where the users table assigns ids.
+    Raises sqlite3.IntegrityError if the username or email is taken.
+    """
+    if SHARD_COUNT == 1:
+        return None, 0
+    conn = connect_directory()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO user_directory (username, email, shard) VALUES (?, ?, -1)
+        ''', (username, email))
+        user_id = cursor.lastrowid
+        shard = home_shard(user_id)
+        cursor.execute('UPDATE user_directory SET shard = ? WHERE user_id = ?', (shard, user_id))
+        conn.commit()
+    finally:
+        conn.close()
+    return user_id, shard
+
+
+def unregister_user(user_id):
+    if SHARD_COUNT == 1:
+        return
+    conn = connect_directory()
+    conn.execute('DELETE FROM user_directory WHERE user_id = ?', (user_id,))
+    conn.commit()
+    conn.close()
+    with _lock:
+        _shard_cache.pop(user_id, None)
+
+
+def scatter(query, connect=connect_shard):
+    """Run query(conn) on every shard in parallel and return the results in shard order"""
+    global _executor
+
+    def run(shard):
+        conn = connect(shard)
+        try:
+            return query(conn)
+        finally:
+            conn.close()
+
+    if SHARD_COUNT == 1:
+        return [run(0)]
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=SHARD_COUNT, thread_name_prefix='stocker-shard')
+    return list(_executor.map(run, range(SHARD_COUNT)))
+
+
+def _copy_user(source, target, user_id):
+    for table, key in (('users', 'id'), ('portfolio', 'user_id'), ('trades', 'user_id')):
+        # Name the columns; the source may predate columns added since
+        columns = [row[1] for row in source.execute(f'PRAGMA table_info({table})')]
+        if table != 'users':
+            # Portfolio and trade ids are per shard, so the target assigns new ones;
+            # user ids are global and come from the directory
+            columns.remove('id')
+        names = ', '.join(columns)
+        rows = source.execute(f'SELECT {names} FROM {table} WHERE {key} = ?', (user_id,)).fetchall()
+        if rows:
+            marks = ', '.join('?' * len(columns))
+            target.executemany(f'INSERT INTO {table} ({names}) VALUES ({marks})', rows)
+
+
+def _delete_user(conn, user_id):
+    conn.execute('DELETE FROM portfolio WHERE user_id = ?', (user_id,))
+    conn.execute('DELETE FROM trades WHERE user_id = ?', (user_id,))
+    conn.execute('DELETE FROM users WHERE id = ?', (user_id,))
+
+
+def move_user(user_id, target_shard):
+    """Move one user's rows to another shard and repoint the directory
+
+    The copy, archived trades included, commits before the directory is
+    updated and the source rows are removed, so a crash part way leaves the
+    user readable from the old shard. Trades the user makes during the move
+    are lost, so move idle users only.
+    """
+    # archive imports this module
+    import archive
+
+    source_shard = shard_for(user_id)
+    if source_shard == target_shard:
+        return False
+
+    source = connect_shard(source_shard)
+    target = connect_shard(target_shard)
+    try:
+        _delete_user(target, user_id)
+        _copy_user(source, target, user_id)
+        target.commit()
+        archive.move_user(user_id, source_shard, target_shard)
+
+        directory = connect_directory()
+        directory.execute('UPDATE user_directory SET shard = ? WHERE user_id = ?',
+                          (target_shard, user_id))
+        directory.commit()
+        directory.close()
+        with _lock:
+            _shard_cache[user_id] = target_shard
+
+        _delete_user(source, user_id)
+        source.commit()
+        archive.purge_user(source_shard, user_id)
+    finally:
+        target.close()
+        source.close()
+    return True
+
+
+def rebalance():
+    """Move every user whose shard differs from its hashed home shard"""
+    conn = connect_directory()
+    rows = conn.execute('SELECT user_id, shard FROM user_directory').fetchall()
+    conn.close()
+    moved = 0
+    for user_id, shard in rows:
+        target = home_shard(user_id)
+        if shard != target and move_user(user_id, target):
+            moved += 1
+    return moved
+
+
+def split(source_path):
+    """Distribute the users of a single-file database across the shards"""
+    source = sqlite3.connect(source_path)
+    directory = connect_directory()
+    users = source.execute('SELECT id, username, email FROM users').fetchall()
+    for user_id, username, email in users:
+        shard = home_shard(user_id)
+        directory.execute('''
+            INSERT OR REPLACE INTO user_directory (user_id, username, email, shard)
+            VALUES (?, ?, ?, ?)
+        ''', (user_id, username, email, shard))
+        target = connect_shard(shard)
+        _delete_user(target, user_id)
+        _copy_user(source, target, user_id)
+        target.commit()
+        target.close()
+    directory.commit()
+    directory.close()
+    source.close()
+    return len(users)
+
+
+def status():
+    """User and trade counts per shard"""
+    def counts(conn):
+        users = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+        trades = conn.execute('SELECT COUNT(*) FROM trades').fetchone()[0]
+        return users, trades
+    return scatter(counts)
+
+
+def main(argv):
+    import app
+
+    app.init_db()
+    if SHARD_COUNT == 1:
+        print('Sharding is disabled; set STOCKER_SHARDS to the number of shards')
+        return 1
+
+    command = argv[0] if argv else 'status'
+    if command == 'split':
+        source = argv[1] if len(argv) > 1 else DATABASE
+        print(f'Copied {split(source)} users from {source} into {SHARD_COUNT} shards')
+    elif command == 'move':
+        user_id, target = int(argv[1]), int(argv[2])
+        if not 0 <= target < SHARD_COUNT:
+            print(f'Shard must be between 0 and {SHARD_COUNT - 1}')
+            return 1
+        print('Moved' if move_user(user_id, target) else 'Already on that shard')
+    elif command == 'rebalance':
+        print(f'Moved {rebalance()} users')
+    elif command != 'status':
+        print(__doc__)
+        return 1
+
+    for shard, (users, trades) in enumerate(status()):
+        print(f'shard {shard} ({shard_path(shard)}): {users} users, {trades} trades')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
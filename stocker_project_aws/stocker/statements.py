@@ -0,0 +1,287 @@
+"""End-of-day account statements for every user
+
+Each shard's users, portfolio and the day's trades are read with one query
+per table, all ordered by user id, and joined as the three cursors advance,
+so the job never runs a per-user query. Users are grouped into batches by id
+range (BATCH_USERS ids per batch); batches are rendered on a process pool and
+written as gzipped JSON lines, one statement per line:
+
+    statements/<date>/<shard>/statements-<first id>.jsonl.gz
+
+Batch files are written atomically and skipped when they already exist, so a
+crashed run is resumed by running it again. manifest.json is written last
+and marks the date as done. With --notify each batch is also published
+to each user's email address through aws_app (SES), and a .sent marker next to the batch
+file keeps a resumed run from sending it twice.
+
+Positions and balances are those at run time and closing prices are the
+last ones the app saved to STOCKER_PRICES_SNAPSHOT (or --prices), so run it
+after the close, e.g. nightly:
+
+    python statements.py                     # today's statements (UTC)
+    python statements.py --date 2024-03-15 --workers 8
+    python statements.py --notify
+"""
+import argparse
+import gzip
+import heapq
+import itertools
+import json
+import operator
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from datetime import datetime, timedelta
+
+import archive
+import jobs
+import sharding
+import symbols
+
+STATEMENTS_DIR = os.environ.get('STOCKER_STATEMENTS_DIR', 'statements')
+BATCH_USERS = int(os.environ.get('STOCKER_STATEMENT_BATCH', 1000))
+
+# Closing prices in the worker processes, set once by _init_worker
+_prices = {}
+
+
+def day_range(day):
+    """Timestamp bounds of a YYYY-MM-DD day, start inclusive and end exclusive"""
+    start = datetime.strptime(day, '%Y-%m-%d')
+    return (start.strftime(archive.TIMESTAMP_FORMAT),
+            (start + timedelta(days=1)).strftime(archive.TIMESTAMP_FORMAT))
+
+
+def statement_dir(day):
+    return os.path.join(STATEMENTS_DIR, day)
+
+
+class _Groups:
+    """Rows sorted by user id, handed out one user at a time"""
+
+    def __init__(self, rows):
+        self._groups = itertools.groupby(rows, key=operator.itemgetter(0))
+        self._current = next(self._groups, None)
+
+    def take(self, user_id):
+        # Groups for smaller ids belong to users without a statement, e.g. deleted ones
+        while self._current is not None and self._current[0] < user_id:
+            self._current = next(self._groups, None)
+        if self._current is None or self._current[0] != user_id:
+            return []
+        rows = [row[1:] for row in self._current[1]]
+        self._current = next(self._groups, None)
+        return rows
+
+
+def _batches(shard, start, end):
+    """Yield (first id of the batch, [(user, positions, trades)]) for one shard"""
+    conn = sharding.connect_shard(shard)
+    try:
+        users = conn.execute('''
+            SELECT id, username, email, balance FROM users
+            WHERE status != ?
+            ORDER BY id
+        ''', (jobs.DELETING,))
+        positions = _Groups(conn.execute('''
+            SELECT user_id, symbol, quantity, avg_price FROM portfolio
+            WHERE quantity > 0
+            ORDER BY user_id, symbol
+        '''))
+        trade_rows = conn.execute('''
+            SELECT user_id, symbol, action, quantity, price, total, timestamp FROM trades
+            WHERE timestamp >= ? AND timestamp < ?
+            ORDER BY user_id, timestamp
+        ''', (start, end))
+        if archive.reaches_archive(shard, start):
+            # The day may have been moved to the archive, which is also sorted by user and time
+            archived = sorted((row[1:] for row in archive.read_trades(shard, start=start, end=end)
+                               if row[7] < end), key=operator.itemgetter(0, 6))
+            trade_rows = heapq.merge(trade_rows, archived, key=operator.itemgetter(0, 6))
+        trades = _Groups(trade_rows)
+
+        batch_start, batch = None, []
+        for user in users:
+            first = user[0] - user[0] % BATCH_USERS
+            if first != batch_start and batch:
+                yield batch_start, batch
+                batch = []
+            batch_start = first
+            batch.append((user, positions.take(user[0]), trades.take(user[0])))
+        if batch:
+            yield batch_start, batch
+    finally:
+        conn.close()
+
+
+def render(day, user, positions, trades, prices):
+    """One user's statement as a dict, with a plain text rendering under 'text'"""
+    user_id, username, email, balance = user
+    lines = [f'Stocker daily statement for {username}, {day}', '', 'Trades']
+
+    bought = sold = 0.0
+    for symbol, action, quantity, price, total, timestamp in trades:
+        if action == 'buy':
+            bought += total
+        else:
+            sold += total
+        lines.append(f'  {timestamp}  {action.upper():<4} {symbol:<6} {quantity:>6} @ ${price:,.2f}  ${total:,.2f}')
+    if not trades:
+        lines.append('  No trades')
+
+    lines.extend(['', 'Positions'])
+    holdings = []
+    market_value = unrealized = 0.0
+    for symbol, quantity, avg_price in positions:
+        close = prices.get(symbol, avg_price)
+        value = quantity * close
+        gain_loss = (close - avg_price) * quantity
+        market_value += value
+        unrealized += gain_loss
+        holdings.append({'symbol': symbol, 'quantity': quantity, 'avg_price': round(avg_price, 2),
+                         'close': round(close, 2), 'value': round(value, 2), 'gain_loss': round(gain_loss, 2)})
+        lines.append(f'  {symbol:<6} {quantity:>6}  avg ${avg_price:,.2f}  close ${close:,.2f}  '
+                     f'value ${value:,.2f}  P&L {gain_loss:+,.2f}')
+    if not positions:
+        lines.append('  No positions')
+
+    lines.extend([
+        '',
+        f'Bought ${bought:,.2f}, sold ${sold:,.2f}',
+        f'Unrealized P&L {unrealized:+,.2f}',
+        f'Cash balance ${balance:,.2f}',
+        f'Market value ${market_value:,.2f}',
+        f'Account value ${balance + market_value:,.2f}',
+    ])
+    return {
+        'user_id': user_id,
+        'username': username,
+        'email': email,
+        'date': day,
+        'trades': [dict(zip(('symbol', 'action', 'quantity', 'price', 'total', 'timestamp'), trade))
+                   for trade in trades],
+        'positions': holdings,
+        'bought': round(bought, 2),
+        'sold': round(sold, 2),
+        'unrealized_pnl': round(unrealized, 2),
+        'closing_balance': round(balance, 2),
+        'market_value': round(market_value, 2),
+        'account_value': round(balance + market_value, 2),
+        'text': '\n'.join(lines),
+    }
+
+
+def _init_worker(prices):
+    global _prices
+    _prices = prices
+
+
+def _write_batch(path, statements):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6) as f:
+            for statement in statements:
+                f.write(json.dumps(statement).encode() + b'\n')
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_batch(path):
+    """Statements stored in one batch file"""
+    with gzip.open(path, 'rt') as f:
+        return [json.loads(line) for line in f]
+
+
+def _process_batch(path, day, records, notify):
+    """Render and write one batch unless records is None (already written), then deliver it if asked"""
+    if records is not None:
+        statements = [render(day, user, positions, trades, _prices) for user, positions, trades in records]
+        _write_batch(path, statements)
+    else:
+        statements = read_batch(path)
+
+    if notify:
+        # Imported here so runs without --notify do not need boto3
+        import aws_app
+        for statement in statements:
+            aws_app.send_statement_notification(statement['email'], day, statement['text'])
+        open(path + '.sent', 'w').close()
+
+
+def generate(day, prices, workers=None, notify=False):
+    """Write statements for every user on every shard; returns a summary dict"""
+    directory = statement_dir(day)
+    manifest_path = os.path.join(directory, 'manifest.json')
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest['notified'] or not notify:
+            return dict(manifest, skipped=manifest['batches'])
+
+    start, end = day_range(day)
+    workers = workers or os.cpu_count()
+    started = time.perf_counter()
+    summary = {'date': day, 'users': 0, 'trades': 0, 'batches': 0, 'skipped': 0, 'notified': notify}
+
+    def collect(done):
+        # Re-raises a worker's error, so the manifest is only written when every batch succeeded
+        for future in done:
+            future.result()
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(prices,)) as executor:
+        pending = set()
+        for shard in range(sharding.SHARD_COUNT):
+            shard_dir = os.path.join(directory, os.path.splitext(os.path.basename(sharding.shard_path(shard)))[0])
+            os.makedirs(shard_dir, exist_ok=True)
+            for batch_start, records in _batches(shard, start, end):
+                summary['batches'] += 1
+                summary['users'] += len(records)
+                summary['trades'] += sum(len(trades) for _, _, trades in records)
+                path = os.path.join(shard_dir, f'statements-{batch_start:010d}.jsonl.gz')
+                written = os.path.exists(path)
+                if written and (not notify or os.path.exists(path + '.sent')):
+                    summary['skipped'] += 1
+                    continue
+
+                # Bound the batches held in memory while the pool catches up
+                if len(pending) >= workers * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending.add(executor.submit(_process_batch, path, day,
+                                            None if written else records, notify))
+        collect(wait(pending).done)
+
+    summary['seconds'] = time.perf_counter() - started
+    summary['completed_at'] = datetime.utcnow().strftime(archive.TIMESTAMP_FORMAT)
+    tmp_path = manifest_path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(summary, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write end-of-day statements for every user')
+    parser.add_argument('--date', default=datetime.utcnow().strftime('%Y-%m-%d'),
+                        help='statement day, YYYY-MM-DD (default: today, UTC)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--prices', default=symbols.PRICES_SNAPSHOT,
+                        help="closing prices as a symbols CSV or SQLite file (default: the app's STOCKER_PRICES_SNAPSHOT)")
+    parser.add_argument('--notify', action='store_true', help='also email each statement to its user through aws_app')
+    args = parser.parse_args(argv)
+
+    # Without real closing prices every position would be valued at the sample list's prices
+    if not os.path.exists(args.prices):
+        parser.error(f'no closing prices at {args.prices}; run the app so it saves them, or pass --prices')
+    prices = {symbol: stock['price'] for symbol, stock in symbols.load_stocks(args.prices).items()}
+    summary = generate(args.date, prices, args.workers, args.notify)
+    print(f"Statements for {summary['date']}: {summary['users']} users and {summary['trades']} trades in "
+          f"{summary['batches'] - summary['skipped']} batches ({summary['skipped']} already done) "
+          f"under {statement_dir(summary['date'])}/")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,10 +2,23 @@
 class StockerApp {
     constructor() {
         this.updateInterval = null;
+        // symbol -> cached elements and last rendered values of a visible stock card
+        this.stockElements = new Map();
+        this.cardEntries = new WeakMap();
+        this.portfolioElements = [];
+        this.stocks = null;
+        this.pendingStocks = null;
+        this.frameRequested = false;
+        this.frameTimes = [];
+        this.virtualGrid = null;
+        // Polling is skipped until this time after a Retry-After from the server
+        this.pollPausedUntil = 0;
         this.init();
     }
 
     init() {
+        this.cacheElements();
+        this.initVirtualGrid();
         this.bindEvents();
         this.startLiveUpdates();
         this.initializeQuantityControls();
@@ -21,15 +34,13 @@ class StockerApp {
             });
         });
 
-        // Stock card clicks
-        const stockCards = document.querySelectorAll('.stock-card');
-        stockCards.forEach(card => {
-            card.addEventListener('click', () => {
-                const symbol = card.dataset.symbol;
-                if (symbol) {
-                    window.location.href = `/trade/${symbol}`;
-                }
-            });
+        // Stock card clicks, delegated so virtualized cards need no listeners of their own
+        document.addEventListener('click', (e) => {
+            const card = e.target.closest('.stock-card');
+            const symbol = card && card.dataset.symbol;
+            if (symbol) {
+                window.location.href = `/trade/${symbol}`;
+            }
         });
 
         // Form validations
@@ -40,10 +51,96 @@ class StockerApp {
 
         // Trade form enhancements
         this.enhanceTradeForm();
+        this.initSymbolSearch();
+    }
+
+    // Ticker and company autocomplete backed by /api/symbols/search
+    initSymbolSearch() {
+        document.querySelectorAll('.symbol-search').forEach(input => {
+            const list = document.getElementById(input.getAttribute('list'));
+            let matches = [];
+
+            const search = this.debounce(async () => {
+                const query = input.value.trim();
+                if (!query) return;
+                try {
+                    const response = await fetch(`/api/symbols/search?q=${encodeURIComponent(query)}&limit=20`);
+                    matches = await response.json();
+                    list.replaceChildren(...matches.map(stock => {
+                        const option = document.createElement('option');
+                        option.value = stock.symbol;
+                        option.textContent = stock.name;
+                        return option;
+                    }));
+                } catch (error) {
+                    console.error('Symbol search failed:', error);
+                }
+            }, 150);
+
+            const go = () => {
+                const value = input.value.trim().toUpperCase();
+                const known = Array.from(list.options).some(option => option.value === value);
+                const symbol = known ? value : (matches[0] && matches[0].symbol);
+                if (symbol) {
+                    window.location.href = `/trade/${symbol}`;
+                }
+            };
+
+            input.addEventListener('input', (e) => {
+                // Picking a datalist suggestion is an input event without a typing inputType
+                const picked = !e.inputType || e.inputType === 'insertReplacementText';
+                if (picked && Array.from(list.options).some(option => option.value === input.value)) {
+                    go();
+                } else {
+                    search();
+                }
+            });
+            input.addEventListener('keydown', (e) => {
+                if (e.key === 'Enter') {
+                    e.preventDefault();
+                    go();
+                }
+            });
+        });
+    }
+
+    // Element references are looked up once instead of on every poll
+    cacheElements() {
+        document.querySelectorAll('.stock-card').forEach(card => {
+            this.stockElements.set(card.dataset.symbol, this.cardEntry(card));
+        });
+
+        this.portfolioElements = Array.from(document.querySelectorAll('.portfolio-item[data-symbol]'), item => ({
+            symbol: item.dataset.symbol,
+            quantity: parseInt(item.dataset.quantity),
+            avgPrice: parseFloat(item.dataset.avgPrice),
+            price: item.querySelector('.portfolio-price'),
+            change: item.querySelector('.portfolio-change'),
+            lastValue: null,
+            lastGain: null
+        }));
+    }
+
+    cardEntry(card) {
+        let entry = this.cardEntries.get(card);
+        if (!entry) {
+            const price = card.querySelector('.stock-price');
+            entry = {
+                card,
+                symbol: card.querySelector('.stock-symbol'),
+                name: card.querySelector('.stock-name'),
+                price,
+                change: card.querySelector('.stock-change'),
+                lastPrice: price ? parseFloat(price.textContent.replace('$', '')) : null,
+                lastChange: null
+            };
+            this.cardEntries.set(card, entry);
+        }
+        return entry;
     }
 
     startLiveUpdates() {
-        if (document.querySelector('.stock-card') || document.querySelector('.portfolio-item')) {
+        if (this.stockElements.size || this.portfolioElements.length || this.virtualGrid) {
             this.updateStockPrices();
             this.updateInterval = setInterval(() => {
                 this.updateStockPrices();
@@ -51,73 +148,218 @@ class StockerApp {
         }
     }
 
+    // Back off when the server is busy; it sends Retry-After with a stale snapshot or an error
+    pollPaused(response) {
+        if (response) {
+            const retryAfter = parseInt(response.headers.get('Retry-After'), 10);
+            if (retryAfter > 0) {
+                this.pollPausedUntil = Date.now() + retryAfter * 1000;
+            }
+        }
+        return Date.now() < this.pollPausedUntil;
+    }
+
     async updateStockPrices() {
+        if (this.pollPaused()) return;
         try {
             const response = await fetch('/api/stocks');
+            this.pollPaused(response);
+            if (!response.ok) return;
             const stocks = await response.json();
             
-            this.updateStockCards(stocks);
-            this.updatePortfolio(stocks);
+            this.scheduleRender(stocks);
             this.updateDashboardStats(stocks);
         } catch (error) {
             console.error('Failed to update stock prices:', error);
         }
     }
 
+    // Batch DOM writes into one animation frame; later data replaces pending data
+    scheduleRender(stocks) {
+        this.pendingStocks = stocks;
+        if (this.frameRequested) return;
+        this.frameRequested = true;
+
+        requestAnimationFrame(() => {
+            const start = performance.now();
+            this.frameRequested = false;
+            this.stocks = this.pendingStocks;
+            this.pendingStocks = null;
+
+            if (this.virtualGrid) {
+                this.renderVirtualGrid();
+            }
+            this.updateStockCards(this.stocks);
+            this.updatePortfolio(this.stocks);
+            this.recordFrame(performance.now() - start);
+        });
+    }
+
     updateStockCards(stocks) {
-        Object.entries(stocks).forEach(([symbol, data]) => {
-            const card = document.querySelector(`[data-symbol="${symbol}"]`);
-            if (card) {
-                const priceElement = card.querySelector('.stock-price');
-                const changeElement = card.querySelector('.stock-change');
-                
-                if (priceElement) {
-                    const oldPrice = parseFloat(priceElement.textContent.replace('$', ''));
-                    const newPrice = data.price;
-                    
-                    priceElement.textContent = `$${newPrice.toFixed(2)}`;
-                    
-                    // Add flash effect for price changes
-                    if (Math.abs(oldPrice - newPrice) > 0.01) {
-                        this.flashElement(priceElement, newPrice > oldPrice ? 'success' : 'danger');
-                    }
-                }
-                
-                if (changeElement) {
-                    const change = data.change;
-                    changeElement.textContent = `${change >= 0 ? '+' : ''}$${change.toFixed(2)}`;
-                    changeElement.className = `stock-change ${change >= 0 ? 'positive' : 'negative'}`;
+        // Only cards in the DOM are touched, and only values that changed
+        this.stockElements.forEach((entry, symbol) => {
+            const data = stocks[symbol];
+            if (!data) return;
+
+            if (entry.price && data.price !== entry.lastPrice) {
+                entry.price.textContent = `$${data.price.toFixed(2)}`;
+
+                // Add flash effect for price changes
+                if (entry.lastPrice !== null && Math.abs(entry.lastPrice - data.price) > 0.01) {
+                    this.flashElement(entry.price, data.price > entry.lastPrice ? 'success' : 'danger');
                 }
+                entry.lastPrice = data.price;
+            }
+
+            if (entry.change && data.change !== entry.lastChange) {
+                const change = data.change;
+                entry.change.textContent = `${change >= 0 ? '+' : ''}$${change.toFixed(2)}`;
+                entry.change.className = `stock-change ${change >= 0 ? 'positive' : 'negative'}`;
+                entry.lastChange = change;
             }
         });
     }
 
     updatePortfolio(stocks) {
-        const portfolioItems = document.querySelectorAll('.portfolio-item');
-        portfolioItems.forEach(item => {
-            const symbol = item.dataset.symbol;
-            if (symbol && stocks[symbol]) {
-                const currentPriceElement = item.querySelector('.portfolio-price');
-                const changeElement = item.querySelector('.portfolio-change');
-                
-                if (currentPriceElement) {
-                    const quantity = parseInt(item.dataset.quantity);
-                    const avgPrice = parseFloat(item.dataset.avgPrice);
-                    const currentPrice = stocks[symbol].price;
-                    const totalValue = quantity * currentPrice;
-                    const gainLoss = (currentPrice - avgPrice) * quantity;
-                    
-                    currentPriceElement.textContent = `$${totalValue.toFixed(2)}`;
-                    
-                    if (changeElement) {
-                        changeElement.textContent = `${gainLoss >= 0 ? '+' : ''}$${gainLoss.toFixed(2)}`;
-                        changeElement.className = `portfolio-change ${gainLoss >= 0 ? 'text-success' : 'text-danger'}`;
-                    }
-                }
+        this.portfolioElements.forEach(entry => {
+            const stock = stocks[entry.symbol];
+            if (!stock || !entry.price) return;
+
+            const totalValue = entry.quantity * stock.price;
+            const gainLoss = (stock.price - entry.avgPrice) * entry.quantity;
+
+            if (totalValue !== entry.lastValue) {
+                entry.price.textContent = `$${totalValue.toFixed(2)}`;
+                entry.lastValue = totalValue;
             }
+
+            if (entry.change && gainLoss !== entry.lastGain) {
+                entry.change.textContent = `${gainLoss >= 0 ? '+' : ''}$${gainLoss.toFixed(2)}`;
+                entry.change.className = `portfolio-change ${gainLoss >= 0 ? 'text-success' : 'text-danger'}`;
+                entry.lastGain = gainLoss;
+            }
+        });
+    }
+
+    // Large symbol universes: keep only the visible rows of cards in the DOM
+    initVirtualGrid() {
+        const container = document.querySelector('.stock-grid-virtual');
+        if (!container) return;
+
+        this.virtualGrid = {
+            container,
+            cards: container.querySelector('.stock-grid-window'),
+            symbols: [],
+            rowHeight: 0,
+            columns: 1,
+            first: -1,
+            last: -1
+        };
+
+        const rerender = () => {
+            if (this.stocks) this.scheduleRender(this.stocks);
+        };
+        window.addEventListener('scroll', rerender, { passive: true });
+        window.addEventListener('resize', () => {
+            this.virtualGrid.rowHeight = 0;
+            rerender();
         });
     }
 
+    createStockCard() {
+        const card = document.createElement('div');
+        card.className = 'stock-card';
+        ['stock-symbol', 'stock-name', 'stock-price', 'stock-change'].forEach(className => {
+            const child = document.createElement('div');
+            child.className = className;
+            card.appendChild(child);
+        });
+        return card;
+    }
+
+    renderVirtualGrid() {
+        const grid = this.virtualGrid;
+        const symbols = Object.keys(this.stocks);
+        if (symbols.length !== grid.symbols.length) {
+            grid.symbols = symbols;
+            grid.first = -1;
+        }
+
+        if (!grid.rowHeight) {
+            // Measure one card to size every row
+            const probe = this.createStockCard();
+            ['SYMBOL', 'Name', '$0.00', '+$0.00'].forEach((text, i) => {
+                probe.children[i].textContent = text;
+            });
+            grid.cards.appendChild(probe);
+            const style = getComputedStyle(grid.cards);
+            grid.rowHeight = probe.offsetHeight + (parseFloat(style.rowGap) || 0);
+            grid.columns = style.gridTemplateColumns.split(' ').length || 1;
+            probe.remove();
+            grid.first = -1;
+            if (!grid.rowHeight) return;
+        }
+
+        const rows = Math.ceil(symbols.length / grid.columns);
+        grid.container.style.height = `${rows * grid.rowHeight}px`;
+
+        const top = grid.container.getBoundingClientRect().top;
+        const overscan = 2;
+        const firstRow = Math.max(0, Math.floor(-top / grid.rowHeight) - overscan);
+        const lastRow = Math.min(rows, Math.ceil((window.innerHeight - top) / grid.rowHeight) + overscan);
+        const first = Math.min(firstRow * grid.columns, symbols.length);
+        const last = Math.max(first, Math.min(lastRow * grid.columns, symbols.length));
+        if (first === grid.first && last === grid.last) return;
+        grid.first = first;
+        grid.last = last;
+
+        grid.cards.style.transform = `translateY(${firstRow * grid.rowHeight}px)`;
+        const cards = grid.cards.children;
+        while (cards.length < last - first) {
+            grid.cards.appendChild(this.createStockCard());
+        }
+        while (cards.length > last - first) {
+            grid.cards.lastChild.remove();
+        }
+
+        // Recycle card elements for the symbols now in view
+        this.stockElements.clear();
+        for (let i = first; i < last; i++) {
+            const entry = this.cardEntry(cards[i - first]);
+            const symbol = symbols[i];
+            if (entry.card.dataset.symbol !== symbol) {
+                entry.card.dataset.symbol = symbol;
+                entry.symbol.textContent = symbol;
+                entry.name.textContent = this.stocks[symbol].name;
+                entry.lastPrice = null;
+                entry.lastChange = null;
+            }
+            this.stockElements.set(symbol, entry);
+        }
+    }
+
+    recordFrame(duration) {
+        this.frameTimes.push(duration);
+        if (this.frameTimes.length > 1000) {
+            this.frameTimes.shift();
+        }
+    }
+
+    // Render timings for the benchmark suite and the browser console
+    frameStats() {
+        const sorted = [...this.frameTimes].sort((a, b) => a - b);
+        const percentile = fraction => sorted.length
+            ? sorted[Math.min(sorted.length - 1, Math.max(0, Math.ceil(fraction * sorted.length) - 1))]
+            : 0;
+        return {
+            frames: sorted.length,
+            p50: percentile(0.50),
+            p95: percentile(0.95),
+            max: sorted.length ? sorted[sorted.length - 1] : 0,
+            cards: document.querySelectorAll('.stock-card').length
+        };
+    }
+
     updateDashboardStats(stocks) {
         // Update portfolio value if on dashboard
         if (window.location.pathname === '/dashboard') {
@@ -127,10 +369,12 @@ class StockerApp {
 
     async updatePortfolioValue() {
         const userId = document.body.dataset.userId;
-        if (!userId) return;
+        if (!userId || this.pollPaused()) return;
 
         try {
             const response = await fetch(`/api/portfolio/${userId}`);
+            this.pollPaused(response);
+            if (!response.ok) return;
             const data = await response.json();
             
             const portfolioValueElement = document.querySelector('#portfolio-value');
@@ -268,6 +512,12 @@ class StockerApp {
                     }
                 } else if (actionType === 'suspend') {
                     this.suspendUser(userId);
+                } else if (actionType === 'activate') {
+                    this.activateUser(userId);
+                } else if (actionType === 'reset') {
+                    if (confirm('Reset this user\'s balance and clear their holdings and trades?')) {
+                        this.resetUser(userId);
+                    }
                 }
             });
         });
@@ -283,7 +533,8 @@ class StockerApp {
             });
 
             if (response.ok) {
-                this.showNotification('User deleted successfully', 'success');
+                // Deletion continues in the background; the page shows its progress
+                this.showNotification('User deletion started', 'success');
                 location.reload();
             } else {
                 throw new Error('Failed to delete user');
@@ -313,6 +564,46 @@ class StockerApp {
         }
     }
 
+    async activateUser(userId) {
+        try {
+            const response = await fetch(`/admin/users/${userId}/activate`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                }
+            });
+
+            if (response.ok) {
+                this.showNotification('User activated successfully', 'success');
+                location.reload();
+            } else {
+                throw new Error('Failed to activate user');
+            }
+        } catch (error) {
+            this.showNotification('Failed to activate user', 'error');
+        }
+    }
+
+    async resetUser(userId) {
+        try {
+            const response = await fetch(`/admin/users/${userId}/reset`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                }
+            });
+
+            if (response.ok) {
+                this.showNotification('User reset started', 'success');
+                location.reload();
+            } else {
+                throw new Error('Failed to reset user');
+            }
+        } catch (error) {
+            this.showNotification('Failed to reset user', 'error');
+        }
+    }
+
     // Utility functions
     formatCurrency(amount) {
         return new Intl.NumberFormat('en-US', {
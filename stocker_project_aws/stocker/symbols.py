@@ -0,0 +1,154 @@
+"""Symbol universe: loading instruments and searching them
+
+The universe is the STOCKS dict of symbol -> {'name', 'price', 'change'}
+shared by the apps. It is loaded from STOCKER_SYMBOLS_FILE when set, either
+a CSV with symbol,name,price[,change] columns or a SQLite database with a
+table of the same columns, and otherwise from the built-in sample list.
+The app saves its live prices in the same CSV format to
+STOCKER_PRICES_SNAPSHOT, which the statements job reads as closing prices.
+
+SymbolIndex keeps tickers and lower-cased name words in sorted lists, so
+prefix search and cursor pagination are a bisect plus a short scan.
+"""
+import bisect
+import csv
+import os
+import sqlite3
+import threading
+
+SYMBOLS_FILE = os.environ.get('STOCKER_SYMBOLS_FILE')
+PRICES_SNAPSHOT = os.environ.get('STOCKER_PRICES_SNAPSHOT', 'prices.csv')
+
+# Sample stock data with realistic prices
+DEFAULT_STOCKS = {
+    'AAPL': {'name': 'Apple Inc.', 'price': 185.50, 'change': 2.75},
+    'GOOGL': {'name': 'Alphabet Inc.', 'price': 142.30, 'change': -1.20},
+    'MSFT': {'name': 'Microsoft Corp.', 'price': 378.85, 'change': 4.60},
+    'AMZN': {'name': 'Amazon.com Inc.', 'price': 145.75, 'change': -2.85},
+    'TSLA': {'name': 'Tesla Inc.', 'price': 248.42, 'change': 8.90},
+    'META': {'name': 'Meta Platforms', 'price': 325.60, 'change': 5.25},
+    'NVDA': {'name': 'NVIDIA Corp.', 'price': 875.30, 'change': 12.40},
+    'NFLX': {'name': 'Netflix Inc.', 'price': 445.20, 'change': -3.75},
+    'ADBE': {'name': 'Adobe Inc.', 'price': 485.90, 'change': 6.80},
+    'CRM': {'name': 'Salesforce Inc.', 'price': 215.40, 'change': -1.95},
+    'ORCL': {'name': 'Oracle Corp.', 'price': 102.85, 'change': 1.30},
+    'IBM': {'name': 'IBM', 'price': 158.75, 'change': 0.85},
+    'INTC': {'name': 'Intel Corp.', 'price': 43.20, 'change': -0.60},
+    'AMD': {'name': 'AMD Inc.', 'price': 142.60, 'change': 3.45},
+    'UBER': {'name': 'Uber Technologies', 'price': 65.40, 'change': 2.10},
+    'LYFT': {'name': 'Lyft Inc.', 'price': 14.85, 'change': -0.35},
+    'SPOT': {'name': 'Spotify Technology', 'price': 185.20, 'change': 4.20},
+    'ZOOM': {'name': 'Zoom Video', 'price': 68.90, 'change': -1.15},
+    'SQ': {'name': 'Block Inc.', 'price': 78.35, 'change': 2.80},
+    'PYPL': {'name': 'PayPal Holdings', 'price': 62.45, 'change': -0.95},
+    'V': {'name': 'Visa Inc.', 'price': 245.70, 'change': 1.85},
+    'MA': {'name': 'Mastercard Inc.', 'price': 385.20, 'change': 3.60},
+    'JPM': {'name': 'JPMorgan Chase', 'price': 158.90, 'change': 2.25},
+    'GS': {'name': 'Goldman Sachs', 'price': 365.80, 'change': -1.40},
+    'WMT': {'name': 'Walmart Inc.', 'price': 158.25, 'change': 0.75},
+    'HD': {'name': 'Home Depot', 'price': 345.60, 'change': 4.15},
+    'PG': {'name': 'Procter & Gamble', 'price': 155.30, 'change': 0.90}
+}
+
+
+def _stock(name, price, change=0.0):
+    return {'name': name, 'price': round(float(price), 2), 'change': round(float(change or 0), 2)}
+
+
+def load_csv(path):
+    with open(path, newline='') as f:
+        return {row['symbol'].strip().upper(): _stock(row['name'], row['price'], row.get('change'))
+                for row in csv.DictReader(f) if row.get('symbol')}
+
+
+def save_csv(path, stocks):
+    """Write a universe as symbols CSV, replacing path atomically"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['symbol', 'name', 'price', 'change'])
+        for symbol, stock in stocks.items():
+            writer.writerow([symbol, stock['name'], stock['price'], stock['change']])
+    os.replace(tmp_path, path)
+
+
+def load_db(path):
+    conn = sqlite3.connect(path)
+    try:
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(symbols)')]
+        change = 'change' if 'change' in columns else '0'
+        rows = conn.execute(f'SELECT symbol, name, price, {change} FROM symbols ORDER BY symbol').fetchall()
+    finally:
+        conn.close()
+    return {symbol.upper(): _stock(name, price, change) for symbol, name, price, change in rows}
+
+
+def load_stocks(path=SYMBOLS_FILE):
+    """A fresh universe dict from path, or a copy of the sample list"""
+    if not path:
+        return {symbol: dict(stock) for symbol, stock in DEFAULT_STOCKS.items()}
+    if path.endswith('.csv'):
+        return load_csv(path)
+    return load_db(path)
+
+
+class SymbolIndex:
+    """Sorted ticker and name-word arrays for prefix search and paging"""
+
+    def __init__(self, stocks):
+        self.size = len(stocks)
+        self.tickers = sorted(stocks)
+        words = sorted((word, symbol)
+                       for symbol, stock in stocks.items()
+                       for word in set(stock['name'].lower().split()))
+        self.words = [word for word, _ in words]
+        self.word_symbols = [symbol for _, symbol in words]
+
+    def search(self, query, limit=20):
+        """Symbols whose ticker or a word of whose name starts with query
+
+        Ticker matches come first, with an exact ticker match at the top.
+        """
+        query = query.strip()
+        if not query:
+            return []
+        results = []
+        seen = set()
+
+        def add(symbol):
+            if symbol not in seen:
+                seen.add(symbol)
+                results.append(symbol)
+
+        ticker = query.upper()
+        i = bisect.bisect_left(self.tickers, ticker)
+        while i < len(self.tickers) and len(results) < limit and self.tickers[i].startswith(ticker):
+            add(self.tickers[i])
+            i += 1
+
+        word = query.lower()
+        i = bisect.bisect_left(self.words, word)
+        while i < len(self.words) and len(results) < limit and self.words[i].startswith(word):
+            add(self.word_symbols[i])
+            i += 1
+        return results
+
+    def page(self, after=None, limit=50):
+        """Up to limit tickers in order, starting after the ticker given as a cursor"""
+        start = bisect.bisect_right(self.tickers, after.upper()) if after else 0
+        symbols = self.tickers[start:start + limit]
+        has_more = start + limit < len(self.tickers)
+        return symbols, (symbols[-1] if has_more and symbols else None)
+
+
+_lock = threading.Lock()
+_index = None
+
+
+def get_index(stocks):
+    """Index for stocks, rebuilt when symbols have been added or removed"""
+    global _index
+    with _lock:
+        if _index is None or _index.size != len(stocks):
+            _index = SymbolIndex(stocks)
+        return _index